@@ -0,0 +1,204 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# 로컬 캐시 파일들이 저장되는 디렉터리
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+
+
+def hash_key(*parts):
+    """여러 값을 하나의 SHA-256 키로 만든다 (모델명, 텍스트 등)"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, bytes):
+            part = repr(part).encode("utf-8")
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    SQLite 기반의 로컬 key-value 캐시.
+    - 전체 크기(max_bytes)를 넘으면 가장 오래 사용되지 않은 항목부터 삭제(LRU)
+    - ttl(초)을 지정하면 저장 후 ttl이 지난 항목은 없는 것으로 취급하고 삭제
+    - hits / misses 카운터로 캐시 효과를 확인할 수 있음
+    """
+
+    def __init__(self, name, max_bytes=512 * 1024 * 1024, ttl=None):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " created REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+        if "created" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN created REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        self._conn.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and created < time.time() - self.ttl
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE key=?", (key,)).fetchone()
+            if row is not None and self._expired(row[1]):
+                self._conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access=? WHERE key=?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def get_many(self, keys):
+        """여러 키를 한 번에 조회. {key: value} (없는 키는 빠짐)"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, value, created FROM entries WHERE key IN ({marks})", batch).fetchall()
+                found.update((k, v) for k, v, created in rows if not self._expired(created))
+            now = time.time()
+            self._conn.executemany("UPDATE entries SET last_access=? WHERE key=?", [(now, k) for k in found])
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries(key, value, size, last_access, created) VALUES (?, ?, ?, ?, ?)",
+                [(k, v, len(v), now, now) for k, v in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 오래 사용되지 않은 항목부터 삭제
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": size}
+
+
+class SingleFlight:
+    """
+    같은 키의 작업이 동시에 여러 번 요청되면 하나(leader)만 실제로 실행하고,
+    나머지는 그 결과를 기다렸다가 함께 사용한다.
+    """
+
+    def __init__(self, timeout=180):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """fn()을 키 단위로 한 번만 실행하고 결과를 공유"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"event": threading.Event(), "result": None, "error": None}
+        if not leader:
+            call["event"].wait(self.timeout)
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
+
+    def begin(self, key):
+        """
+        조회/저장이 분리된 경우(LangChain 캐시)용.
+        True 이면 이 호출이 leader, False 이면 wait()으로 leader의 완료를 기다린다.
+        leader가 timeout 안에 end()를 호출하지 않으면(실패 등) 다음 호출이 leader가 된다.
+        """
+        now = time.time()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None or call.get("started", now) < now - self.timeout:
+                self._calls[key] = {"event": threading.Event(), "started": now}
+                return True
+            return False
+
+    def wait(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+        if call is not None:
+            call["event"].wait(self.timeout)
+
+    def end(self, key):
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call["event"].set()
+
+
+def normalize_prompt(prompt):
+    """공백 차이만 있는 프롬프트가 같은 캐시 키를 갖도록 정규화"""
+    return " ".join(prompt.split())
+
+
+_response_cache = None
+response_flight = SingleFlight()
+
+
+def getResponseCache():
+    # temperature 0 LLM 응답 캐시 (프로세스 전체 공유, 7일 TTL)
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = DiskCache("llm_responses", max_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600)
+    return _response_cache
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+from MyCache import CACHE_DIR
+
+# 문서별 FAISS 인덱스가 저장되는 디렉터리
+INDEX_DIR = os.path.join(CACHE_DIR, "indexes")
+
+
+def file_digest(files):
+    """업로드된 파일(들)의 바이트로 SHA-256 다이제스트를 계산"""
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+    h = hashlib.sha256()
+    for f in files:
+        data = f.getvalue() if hasattr(f, "getvalue") else f
+        if len(files) > 1:
+            h.update(hashlib.sha256(data).digest())
+        else:
+            h.update(data)
+    return h.hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class DocIndexStore:
+    """
+    업로드된 문서의 추출 텍스트와 FAISS 인덱스(+청크 메타데이터)를
+    문서 다이제스트 단위로 디스크에 저장/재사용한다.
+    - 같은 파일이 다시 업로드되면 (사용자/페이지와 무관하게) 저장된 인덱스를 불러옴
+    - 인덱스 파일은 가능하면 memory-map 으로 읽음
+    - 전체 용량(max_bytes)을 넘으면 가장 오래 사용되지 않은 문서부터 삭제
+    """
+
+    def __init__(self, root=INDEX_DIR, max_bytes=2 * 1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest)
+
+    def _read_meta(self, digest):
+        try:
+            with open(os.path.join(self._path(digest), "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, digest, meta):
+        meta["last_used"] = time.time()
+        with open(os.path.join(self._path(digest), "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def get_meta(self, digest):
+        return self._read_meta(digest)
+
+    def get_text(self, digest):
+        """저장된 추출 텍스트 반환 (없으면 None)"""
+        meta = self._read_meta(digest)
+        if meta is None:
+            return None
+        try:
+            with open(os.path.join(self._path(digest), "text.txt"), encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._write_meta(digest, meta)
+        return text
+
+    def save_text(self, digest, text, **meta):
+        with self._lock:
+            os.makedirs(self._path(digest), exist_ok=True)
+            with open(os.path.join(self._path(digest), "text.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+            old = self._read_meta(digest) or {}
+            old.update(meta)
+            self._write_meta(digest, old)
+            self._evict(keep=digest)
+
+    def load(self, digest, embeddings, index_tag):
+        """저장된 FAISS 인덱스를 불러옴. 없거나 인덱스 태그(임베딩 모델/청크 방식)가 다르면 None"""
+        meta = self._read_meta(digest)
+        if meta is None or meta.get("index_tag") != index_tag:
+            return None
+        path = self._path(digest)
+        index_file = os.path.join(path, "index.faiss")
+        if not os.path.exists(index_file):
+            return None
+
+        import faiss
+        from langchain_community.vectorstores import FAISS
+
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            # mmap 을 지원하지 않는 인덱스 유형이면 일반 로드
+            index = faiss.read_index(index_file)
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        with self._lock:
+            self._write_meta(digest, meta)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    def save(self, digest, vectorstore, index_tag, **meta):
+        with self._lock:
+            path = self._path(digest)
+            os.makedirs(path, exist_ok=True)
+            vectorstore.save_local(path)
+            old = self._read_meta(digest) or {}
+            old.update(meta)
+            old["index_tag"] = index_tag
+            old["chunks"] = vectorstore.index.ntotal
+            self._write_meta(digest, old)
+            self._evict(keep=digest)
+
+    def _evict(self, keep=None):
+        entries = []
+        for digest in os.listdir(self.root):
+            path = self._path(digest)
+            if not os.path.isdir(path):
+                continue
+            meta = self._read_meta(digest) or {}
+            entries.append((meta.get("last_used", 0), digest, _dir_size(path)))
+        total = sum(e[2] for e in entries)
+        for _, digest, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            shutil.rmtree(self._path(digest), ignore_errors=True)
+            total -= size
+
+
+_doc_index_store = None
+
+
+def getDocIndexStore():
+    global _doc_index_store
+    if _doc_index_store is None:
+        _doc_index_store = DocIndexStore()
+    return _doc_index_store
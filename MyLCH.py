@@ -1,124 +1,722 @@
+import contextvars
+import math
+import re
+import threading
 import time
+import zlib
+from array import array
+from bisect import bisect_right
 
-from PyPDF2 import PdfReader
-from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferWindowMemory
-from langchain_community.chat_models import ChatOpenAI
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_text_splitters import CharacterTextSplitter, RecursiveCharacterTextSplitter
-from openai import OpenAI
-import google.generativeai as genai
+# 무거운 라이브러리(langchain 체인, langchain_community, FAISS, tiktoken, Gemini, PDF)는
+# 처음 사용하는 함수 안에서 import 한다. 가벼운 페이지(메인, 달력 메모)가 전체 스택을 로드하지 않도록.
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
 from dotenv import load_dotenv
 import os
 import streamlit as st
 
+from MyCache import DiskCache, getResponseCache, hash_key, normalize_prompt, response_flight
+from MyIndex import file_digest, getDocIndexStore
+from MyLLM import makeAudio, run_parallel  # makeAudio: 기존 호출 호환
+from MyRegistry import get_shared, getHttpClient, getOpenAIClient
+from MyTelemetry import TelemetryCallbackHandler, TimedCall, record_ttft
+
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY")
 
+# 이 컨텍스트(요청)가 leader 로 잡고 있는 응답 캐시 키들. 호출이 실패하면 CacheReleaseHandler 가 풀어 줌
+_leading_keys = contextvars.ContextVar("leading_cache_keys", default=())
+
+class LLMResponseCache(BaseCache):
+    """
+    temperature 0 LLM 응답을 (모델, temperature, 정규화된 프롬프트) 키로 공유하는 LangChain 캐시.
+    같은 프롬프트가 여러 세션에서 동시에 요청되면 첫 요청의 응답을 기다렸다가 함께 사용한다.
+    """
+
+    def __init__(self, model, temperature=0):
+        self.model = model
+        self.temperature = temperature
+        self.store = getResponseCache()
+
+    def _key(self, prompt, llm_string):
+        # llm_string 의 '---' 뒤에는 stop 시퀀스가 붙음
+        stop = llm_string.rsplit("---", 1)[-1] if "---" in llm_string else ""
+        return hash_key(self.model, self.temperature, normalize_prompt(prompt), stop)
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        value = self.store.get(key)
+        if value is None:
+            if response_flight.begin(key):
+                _leading_keys.set(_leading_keys.get() + (key,))
+            else:
+                # 같은 요청이 이미 진행 중이면 그 결과를 기다림
+                response_flight.wait(key)
+                value = self.store.get(key)
+        if value is None:
+            return None
+        return loads(value.decode("utf-8"))
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        self.store.set(key, dumps(return_val).encode("utf-8"))
+        _leading_keys.set(tuple(k for k in _leading_keys.get() if k != key))
+        response_flight.end(key)
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+class CacheReleaseHandler(BaseCallbackHandler):
+    """
+    LLM 호출이 실패하거나 중단되면(스트리밍 중 Streamlit 재실행/중지 포함) LangChain 은 캐시 update 를
+    호출하지 않는다. 이 컨텍스트가 잡아 둔 키를 여기서 풀어, 같은 프롬프트를 기다리는 요청이 timeout 까지 막히지 않게 한다.
+    """
+
+    def on_llm_error(self, error, **kwargs):
+        for key in _leading_keys.get():
+            response_flight.end(key)
+        _leading_keys.set(())
+
+#temperature 0 ChatOpenAI 모델 (프로세스 전체에서 모델/스트리밍 여부별로 하나만 만들어 공유)
+def getChatOpenAI(model='gpt-4o', streaming=False):
+    from langchain_community.chat_models import ChatOpenAI
+
+    return get_shared(("chat_openai", model, streaming), lambda: ChatOpenAI(
+        temperature=0,
+        model_name=model,
+        streaming=streaming,
+        cache=LLMResponseCache(model),
+        http_client=getHttpClient(),
+        callbacks=[TelemetryCallbackHandler(model), CacheReleaseHandler()],
+    ))
+
 # OpenAI LLM Model
 def getOpenAI():
-    llm = ChatOpenAI(temperature=0, model_name='gpt-4o')
-    return llm
+    return getChatOpenAI('gpt-4o')
+
+# OpenAI LLM Model (토큰 스트리밍)
+def getOpenAIStream():
+    return getChatOpenAI('gpt-4o', streaming=True)
+
+class StreamlitWriter(BaseCallbackHandler):
+    """
+    스트리밍 LLM의 토큰을 받는 즉시 Streamlit 화면에 출력하는 콜백.
+    생성 시점부터 첫 토큰까지의 시간(ttft)을 MyTelemetry 에 페이지별로 기록한다 (관리자 페이지/Prometheus 에 표시).
+    """
+
+    def __init__(self, container=None, page=None):
+        self.placeholder = (container or st).empty()
+        self.page = page
+        self.text = ""
+        self.started = time.perf_counter()
+        self.ttft = None
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+            record_ttft(self.ttft, self.page)
+        self.text += token
+        self.placeholder.markdown(self.text + "▌")
+
+    def finish(self, text=None, keep=True):
+        # 캐시 응답 등으로 토큰이 오지 않았으면 최종 텍스트로 출력
+        if text is not None:
+            self.text = text
+        if keep:
+            self.placeholder.markdown(self.text)
+        else:
+            self.placeholder.empty()
+        return self.text
+
+#프롬프트를 스트리밍으로 실행하여 화면에 출력하고, 전체 응답 텍스트를 반환
+def stream_predict(prompt, container=None, page=None, keep=True, llm=None, callbacks=None):
+    writer = StreamlitWriter(container, page=page)
+    text = (llm or getOpenAIStream()).predict(prompt, callbacks=[writer] + list(callbacks or []))
+    return writer.finish(text, keep=keep)
 
 # Gemini LLM Model
 def getGenAI():
-    llm = ChatGoogleGenerativeAI(
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return get_shared("chat_gemini", lambda: ChatGoogleGenerativeAI(
         model="gemini-1.5-flash",
         temperature=0,
         max_output_tokens=200,
-        google_api_key=GOOGLE_API_KEY
-    )
-    return llm
-
-def progressBar(txt):
-    # Progress Bar Start -----------------------------------------
-    progress_text = txt
-    my_bar = st.progress(0, text=progress_text)
-    for percent_complete in range(100):
-        time.sleep(0.08)
-        my_bar.progress(percent_complete + 1, text=progress_text)
-    time.sleep(1)
-    return my_bar
-    # Progress Bar End -----------------------------------------
+        google_api_key=GOOGLE_API_KEY,
+        cache=LLMResponseCache("gemini-1.5-flash"),
+        callbacks=[TelemetryCallbackHandler("gemini-1.5-flash"), CacheReleaseHandler()],
+    ))
 
 def openAiModel():
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    return client
-def makeAudio(text, name):
-    if not os.path.exists("audio"):
-        os.makedirs("audio")
-    model = openAiModel()
-    response = model.audio.speech.create(
-        model="tts-1",
-        input=text,
-        #["alloy", "echo", "fable", "onyx", "nova", "shimmer"],
-        voice="echo",
-        response_format="mp3",
-        speed=1.2,
-    )
-    response.stream_to_file("audio/"+name)
+    return getOpenAIClient()
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+_embedding_cache = None
+
+def getEmbeddingCache():
+    # 임베딩 캐시는 프로세스 전체에서 하나만 사용
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = DiskCache("embeddings", max_bytes=1024 * 1024 * 1024)
+    return _embedding_cache
+
+def embedding_cache_stats():
+    return getEmbeddingCache().stats()
+
+class CachedEmbeddings(Embeddings):
+    """
+    (임베딩 태그, 청크 텍스트 해시)를 키로 벡터를 로컬 디스크에 캐시하는 임베딩 래퍼.
+    처음 보는 청크만 실제 임베딩 API로 전송한다.
+    """
+
+    def __init__(self, embeddings, tag):
+        self.embeddings = embeddings
+        self.tag = tag
+        self.cache = getEmbeddingCache()
+
+    def _key(self, text):
+        return hash_key(self.tag, text)
+
+    def embed_documents(self, texts):
+        keys = [self._key(t) for t in texts]
+        found = self.cache.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            with TimedCall("embedding", self.tag.split(":", 1)[-1]) as call:
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+                call.input_tokens = sum(count_tokens(t) for t in missing.values())
+            new_items = {key: array("f", vec).tobytes() for key, vec in zip(missing, vectors)}
+            self.cache.set_many(new_items)
+            found.update(new_items)
+        result = []
+        for key in keys:
+            vec = array("f")
+            vec.frombytes(found[key])
+            result.append(vec.tolist())
+        return result
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class HashingEmbeddings(Embeddings):
+    """
+    네트워크 없이 CPU에서 계산하는 해시 n-gram 임베딩 (오프라인/벤치마크용).
+    단어와 문자 n-gram을 고정 차원으로 해싱한 뒤 L2 정규화한다.
+    한글은 어절 안의 음절 n-gram이 조사/어미 변화에도 겹치므로 간단한 검색에는 충분하다.
+    """
+
+    def __init__(self, dim=512, ngram_range=(2, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text):
+        for word in re.findall(r"\w+", text.lower()):
+            yield word
+            padded = f"<{word}>"
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n]
+
+    def _embed(self, text):
+        vec = [0.0] * self.dim
+        for feature in self._features(text):
+            # 파이썬 hash()는 프로세스마다 달라지므로 crc32 사용
+            h = zlib.crc32(feature.encode("utf-8"))
+            vec[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+# 임베딩 제공자: {이름: (모델 이름, 생성 함수)}. EMBEDDING_PROVIDER 환경 변수로 선택
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+def _openai_embeddings():
+    from langchain_community.embeddings import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL, api_key=OPENAI_API_KEY, chunk_size=EMBEDDING_BATCH_SIZE, http_client=getHttpClient())
+
+EMBEDDING_PROVIDERS = {
+    "openai": (EMBEDDING_MODEL, _openai_embeddings),
+    "local": ("hash-ngram-512", lambda: HashingEmbeddings(dim=512)),
+}
+
+def getEmbeddingProvider():
+    provider = os.getenv("EMBEDDING_PROVIDER", "openai").strip().lower()
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"알 수 없는 임베딩 제공자: {provider} (사용 가능: {', '.join(EMBEDDING_PROVIDERS)})")
+    return provider
+
+def embedding_tag(provider=None):
+    """벡터 공간을 구분하는 태그 (예: openai:text-embedding-ada-002). 캐시/인덱스 키에 사용"""
+    provider = provider or getEmbeddingProvider()
+    return f"{provider}:{EMBEDDING_PROVIDERS[provider][0]}"
+
+def getEmbeddings(provider=None):
+    """설정된 제공자의 임베딩 (디스크 캐시 포함). 반환 객체의 .tag 로 벡터 공간을 구분"""
+    provider = provider or getEmbeddingProvider()
+    _, factory = EMBEDDING_PROVIDERS[provider]
+    return get_shared(("embeddings", provider), lambda: CachedEmbeddings(factory(), embedding_tag(provider)))
 
 def getOpenAIEmbeddings():
-    embeddings = OpenAIEmbeddings(model="text-embedding-ada-002", api_key=OPENAI_API_KEY)
-    return embeddings
+    return getEmbeddings("openai")
 def process_text(text):
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(text)
+    from langchain_community.vectorstores import FAISS
+
+    chunks = get_text_chunks(text)
 
-    #임베딩 처리(벡터 변환), 임베딩은 OpenAI 모델을 사용합니다.
-    embeddings = getOpenAIEmbeddings()
+    #임베딩 처리(벡터 변환), 임베딩은 EMBEDDING_PROVIDER 설정(기본 OpenAI)을 따릅니다.
+    embeddings = getEmbeddings()
     documents = FAISS.from_texts(chunks, embeddings)
     return documents
 
 
 
-#PDF 문서에서 텍스트를 추출
+#PDF 문서에서 텍스트를 추출 (페이지 단위로 추출 후 한 번에 합침)
 def get_pdf_text(pdf_docs):
-    text = ""
-    for pdf in pdf_docs:
-        pdf_reader = PdfReader(pdf)
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
-
-#지정된 조건에 따라 주어진 텍스트를 더 작은 덩어리로 분할
-def get_text_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators="\\n",
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
+    from MyPDF import iter_pdf_documents
+
+    return "\n".join(page["text"] for page in iter_pdf_documents(pdf_docs))
+
+#PDF 문서의 텍스트와 각 페이지가 시작하는 위치(문자 오프셋), 파일 이름, 파일 안에서의 페이지 번호(1부터)를 함께 반환
+def get_pdf_pages_text(pdf_docs):
+    from MyPDF import iter_pdf_documents
+
+    parts = []
+    page_starts = []
+    offset = 0
+    for page in iter_pdf_documents(pdf_docs):
+        page_starts.append({"offset": offset, "source": page["source"], "page": page["page"]})
+        parts.append(page["text"])
+        offset += len(page["text"]) + 1
+    return "\n".join(parts), page_starts
+
+# 청크 크기/겹침(토큰 단위)과, stuff 체인에 넣을 문서 컨텍스트의 최대 토큰 수
+CHUNK_TOKENS = 500
+CHUNK_OVERLAP_TOKENS = 50
+CONTEXT_TOKEN_BUDGET = 6000
+# 문단 → 줄 → 문장(영어/한국어 종결부호) → 단어 → 글자 순으로 자르는 구분자(정규식)
+CHUNK_SEPARATORS = [r"\n\s*\n", r"\n", r"(?<=[.!?。！？])\s+", r"(?<=[다요]\.)", r"\s+", ""]
+# 청크 메타데이터 형식이 바뀌면 올려서 예전 인덱스를 다시 만듦 (2: 파일별 페이지 번호와 source)
+CHUNK_METADATA_VERSION = 2
+# 임베딩 제공자나 청크 방식이 바뀌면 저장된 문서 인덱스를 다시 만들도록 인덱스 태그에 포함
+# (제공자가 다른 벡터가 한 인덱스에 섞이지 않음)
+def document_index_tag(embeddings):
+    return f"{embeddings.tag}:tok{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}:meta{CHUNK_METADATA_VERSION}"
+
+#지정된 조건에 따라 주어진 텍스트를 더 작은 덩어리로 분할 (토큰 수 기준, 문단/문장 경계 우선)
+def get_text_chunks(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=getEncoding().name,
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        separators=CHUNK_SEPARATORS,
+        is_separator_regex=True,
     )
-    chunks = text_splitter.split_text(text)
-    return chunks
+    chunks = [c.strip() for c in text_splitter.split_text(text)]
+    return [c for c in chunks if c]
+
+#관련도 순으로 정렬된 문서들을 토큰 예산 안에서 앞에서부터 채움
+def pack_documents(docs, budget_tokens=CONTEXT_TOKEN_BUDGET):
+    packed, used = [], 0
+    for doc in docs:
+        n = count_tokens(doc.page_content)
+        if used + n > budget_tokens:
+            continue
+        packed.append(doc)
+        used += n
+    return packed
+
+# 참고문헌(웹 페이지 등)을 나눌 청크 크기와, 프롬프트에 넣을 관련 구절의 최대 토큰 수
+REFERENCE_CHUNK_TOKENS = 200
+REFERENCE_CHUNK_OVERLAP_TOKENS = 20
+REFERENCE_TOKEN_BUDGET = 2500
+
+#여러 참고문헌 본문에서 query 와 관련된 구절만 골라 토큰 예산 안에서 반환
+def select_passages(query, texts, budget_tokens=REFERENCE_TOKEN_BUDGET, use_embeddings=True):
+    """
+    texts 의 각 본문을 작은 청크로 나누고 BM25 와 임베딩 유사도 순위를 RRF로 합쳐
+    관련도 높은 것부터 예산만큼 채운다. 결과는 출처/위치 순으로 정렬한
+    [{"source": texts 안의 번호, "start": 글자 위치, "end": 글자 위치, "text": 구절}, ...]
+    """
+    from MyRetriever import BM25Index, reciprocal_rank_fusion
+
+    passages = []
+    for source, text in enumerate(texts):
+        pos = 0
+        for chunk in get_text_chunks(text, REFERENCE_CHUNK_TOKENS, REFERENCE_CHUNK_OVERLAP_TOKENS):
+            # 청크는 겹치므로 이전 청크 시작 바로 뒤부터 찾음
+            start = text.find(chunk, pos)
+            if start < 0:
+                start = max(text.find(chunk), 0)
+            passages.append({"source": source, "start": start, "end": start + len(chunk), "text": chunk})
+            pos = start + 1
+    if not passages:
+        return []
+
+    chunks = [p["text"] for p in passages]
+    rankings = [[i for i, _ in BM25Index(chunks).search(query, k=len(chunks))]]
+    if use_embeddings:
+        try:
+            embeddings = getEmbeddings()
+            q = embeddings.embed_query(query)
+            # 두 제공자 모두 정규화된 벡터이므로 내적 = 코사인 유사도
+            sims = [sum(a * b for a, b in zip(q, v)) for v in embeddings.embed_documents(chunks)]
+            rankings.append(sorted(range(len(chunks)), key=sims.__getitem__, reverse=True))
+        except Exception:
+            pass
+    # 관련도를 전혀 알 수 없으면 (키워드 일치도, 임베딩도 없음) 문서 앞쪽부터
+    order = reciprocal_rank_fusion(rankings) or list(range(len(chunks)))
+
+    selected, used = [], 0
+    for i in order:
+        n = count_tokens(chunks[i])
+        if used + n > budget_tokens:
+            continue
+        selected.append(passages[i])
+        used += n
+
+    # 같은 출처에서 겹치거나 맞닿은 구절은 하나로 합침 (겹침 부분이 두 번 들어가지 않음)
+    merged = []
+    for p in sorted(selected, key=lambda p: (p["source"], p["start"])):
+        last = merged[-1] if merged else None
+        if last and last["source"] == p["source"] and p["start"] <= last["end"] + 1:
+            end = max(last["end"], p["end"])
+            text = texts[p["source"]]
+            last.update(end=end, text=text[last["start"]:end].strip())
+        else:
+            merged.append(dict(p))
+    return merged
 
 #주어진 텍스트 청크에 대한 임베딩을 생성하고 FAISS를 사용하여 벡터 저장소를 생성
-def get_vectorstore(text_chunks):
-    embeddings = getOpenAIEmbeddings()
-    vectorstore = FAISS.from_texts(texts=text_chunks, embedding=embeddings)
+def get_vectorstore(text_chunks, metadatas=None):
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = getEmbeddings()
+    vectorstore = FAISS.from_texts(texts=text_chunks, embedding=embeddings, metadatas=metadatas)
     return vectorstore
+#벡터 저장소에 문서를 id 단위로 추가 (추가되는 문서만 임베딩)
+def add_documents_by_id(vectorstore, docs, ids):
+    from langchain_community.vectorstores import FAISS
 
+    if vectorstore is None:
+        return FAISS.from_documents(docs, getEmbeddings(), ids=ids)
+    vectorstore.add_documents(docs, ids=ids)
+    return vectorstore
+
+#벡터 저장소에서 id 에 해당하는 문서를 제거 (임베딩 재계산 없음)
+def delete_documents_by_id(vectorstore, ids):
+    if vectorstore is None:
+        return None
+    # 다른 세션/탭에서 저장한 항목은 이 세션의 인덱스에 없을 수 있음 (FAISS.delete 는 없는 id 에 ValueError)
+    known = set(vectorstore.index_to_docstore_id.values())
+    ids = [i for i in ids if i in known]
+    if not ids:
+        return vectorstore
+    vectorstore.delete(ids)
+    if vectorstore.index.ntotal == 0:
+        return None
+    return vectorstore
+
+#문서 id 목록(ids) 안에서만 query 와 가까운 k개를 검색 (FAISS IDSelector 로 인덱스 안에서 후보를 제한)
+def similarity_search_in_ids(vectorstore, query, ids, k=4):
+    import faiss
+    import numpy as np
+
+    if vectorstore is None:
+        return []
+    positions = {doc_id: pos for pos, doc_id in vectorstore.index_to_docstore_id.items()}
+    subset = np.array([positions[i] for i in ids if i in positions], dtype="int64")
+    if not len(subset):
+        return []
+    query_vector = np.array([getEmbeddings().embed_query(query)], dtype="float32")
+    selector = faiss.IDSelectorBatch(len(subset), faiss.swig_ptr(subset))
+    _, found = vectorstore.index.search(query_vector, min(k, len(subset)), params=faiss.SearchParameters(sel=selector))
+    return [vectorstore.docstore.search(vectorstore.index_to_docstore_id[pos]) for pos in found[0] if pos >= 0]
+
+#업로드된 PDF의 텍스트를 가져옴 (같은 파일이면 저장된 텍스트 재사용)
+def get_document_text(pdf_docs):
+    store = getDocIndexStore()
+    digest = file_digest(pdf_docs)
+    # 페이지 시작 정보(page_starts)가 없는 예전 형식이면 다시 추출
+    text = store.get_text(digest) if "page_starts" in (store.get_meta(digest) or {}) else None
+    if text is None:
+        text, page_starts = get_pdf_pages_text(pdf_docs)
+        store.save_text(digest, text, pages=len(page_starts), page_starts=page_starts)
+    return digest, text
+
+#청크가 시작하는 위치로 파일 이름(source)과 그 파일 안의 페이지 번호(1부터)를 찾아 메타데이터로 붙임
+def get_chunk_metadatas(text, chunks, page_starts):
+    page_offsets = [p["offset"] for p in page_starts]
+    metadatas = []
+    cursor = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start < 0:
+            start = cursor
+        else:
+            cursor = start + 1
+        if page_starts:
+            page = page_starts[bisect_right(page_offsets, start) - 1]
+            metadatas.append({"source": page["source"], "page": page["page"], "start": start})
+        else:
+            metadatas.append({"source": None, "page": None, "start": start})
+    return metadatas
+
+#업로드된 PDF의 FAISS 벡터 저장소를 가져옴 (같은 파일이면 저장된 인덱스 재사용)
+#progress(StageProgress)를 넘기면 "extract", "chunk", "embed" 단계를 표시
+def load_document_index(pdf_docs, progress=None):
+    from langchain_community.vectorstores import FAISS
+
+    store = getDocIndexStore()
+    digest = file_digest(pdf_docs)
+    embeddings = getEmbeddings()
+    index_tag = document_index_tag(embeddings)
+    vectorstore = store.load(digest, embeddings, index_tag)
+    if vectorstore is None:
+        if progress:
+            progress.stage("extract")
+        _, text = get_document_text(pdf_docs)
+        if progress:
+            progress.stage("chunk")
+        chunks = get_text_chunks(text)
+        page_starts = (store.get_meta(digest) or {}).get("page_starts", [])
+        if progress:
+            progress.stage("embed")
+        vectorstore = FAISS.from_texts(
+            texts=chunks, embedding=embeddings, metadatas=get_chunk_metadatas(text, chunks, page_starts)
+        )
+        store.save(digest, vectorstore, index_tag)
+    return digest, vectorstore
 
 #주어진 벡터 저장소로 대화 체인을 초기화
+#대화 기록은 체인에 두지 않고 호출할 때 chat_history(RollingChatMemory.as_text())로 넘김
 def get_conversation_chain(vectorstore):
-    memory = ConversationBufferWindowMemory(memory_key='chat_history', return_message=True)  #ConversationBufferWindowMemory에 이전 대화 저장
+    from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
+    from MyRetriever import HybridRetriever
+
     conversation_chain = ConversationalRetrievalChain.from_llm(
-        llm=getOpenAI(),
-        retriever=vectorstore.as_retriever(),
+        llm=getOpenAIStream(),
+        condense_question_llm=getOpenAI(),
+        retriever=HybridRetriever.from_vectorstore(vectorstore, k=12),  #벡터 + BM25 키워드 검색을 합친 결과
+        max_tokens_limit=CONTEXT_TOKEN_BUDGET,  #관련도 순으로 토큰 예산까지만 문서를 채움
         get_chat_history=lambda h: h,
-        memory=memory
     ) #ConversationalRetrievalChain을 통해 langchain 챗봇에 쿼리 전송
     return conversation_chain
+# --- 토큰 수 계산 ---
+_encoding = None
+
+def getEncoding():
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+
+        try:
+            _encoding = tiktoken.encoding_for_model("gpt-4o")
+        except Exception:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def count_tokens(text):
+    return len(getEncoding().encode(text or "", disallowed_special=()))
+
+# --- 계층적(map-reduce) 요약 ---
+SUMMARY_MAP_PROMPT = (
+    "다음은 긴 문서의 일부입니다. 중요한 개념, 사실, 수치, 용어를 빠뜨리지 말고 "
+    "한국어로 핵심만 간결하게 요약하세요.\n\n{text}"
+)
+SUMMARY_REDUCE_PROMPT = (
+    "다음은 긴 문서를 나누어 만든 부분 요약들입니다. 순서를 유지하면서 중복을 제거하고 "
+    "하나의 한국어 요약으로 통합하세요. 중요한 개념과 섹션 구성은 빠뜨리지 마세요.\n\n{text}"
+)
+_summary_cache = None
+
+def getSummaryCache():
+    global _summary_cache
+    if _summary_cache is None:
+        _summary_cache = DiskCache("summaries", max_bytes=128 * 1024 * 1024)
+    return _summary_cache
+
+# 부분 요약 하나가 실패(429 등)해도 전체가 중단되지 않도록 잠시 쉬었다가 다시 시도
+SUMMARY_RETRIES = 3
+SUMMARY_RETRY_DELAY = 2.0
+
+def _predict_with_retry(llm, prompt, retries=SUMMARY_RETRIES, delay=SUMMARY_RETRY_DELAY):
+    for attempt in range(retries + 1):
+        try:
+            return llm.predict(prompt)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+def _summarize_parts(llm, parts, template, max_workers):
+    """각 부분을 동시에 요약 (같은 내용의 부분 요약은 캐시에서 재사용)"""
+    model = getattr(llm, "model_name", "")
+    cache = getSummaryCache()
+    keys = [hash_key(model, template, part) for part in parts]
+    found = cache.get_many(list(set(keys)))
+    tasks = {}
+    for i, (key, part) in enumerate(zip(keys, parts)):
+        if key not in found:
+            tasks[i] = lambda part=part: _predict_with_retry(llm, template.format(text=part))
+    for i, result, error in run_parallel(tasks, max_workers=max_workers):
+        if error is not None:
+            raise error
+        found[keys[i]] = result.encode("utf-8")
+        cache.set(keys[i], found[keys[i]])
+    return [found[key].decode("utf-8") for key in keys]
+
+def _group_by_tokens(texts, max_tokens):
+    groups, current, size = [], [], 0
+    for text in texts:
+        n = count_tokens(text)
+        if current and size + n > max_tokens:
+            groups.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += n
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+def summarize_hierarchical(text, target_tokens=3000, chunk_tokens=3000, max_workers=4, llm=None, max_rounds=6):
+    """
+    긴 텍스트를 토큰 단위 청크로 나누어 동시에 요약(map)한 뒤,
+    부분 요약들을 묶어 다시 요약(reduce)하는 과정을 target_tokens 이하가 될 때까지 반복한다.
+    target_tokens 이하인 텍스트는 그대로 반환하며, 잘라내서 버리는 부분은 없다.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if not text or count_tokens(text) <= target_tokens:
+        return text or ""
+    llm = llm or getOpenAI()
+    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=getEncoding().name, chunk_size=chunk_tokens, chunk_overlap=0
+    )
+    parts = _summarize_parts(llm, splitter.split_text(text), SUMMARY_MAP_PROMPT, max_workers)
+    summary = "\n\n".join(parts)
+    for _ in range(max_rounds):
+        if count_tokens(summary) <= target_tokens:
+            break
+        groups = _group_by_tokens(parts, chunk_tokens)
+        parts = _summarize_parts(llm, groups, SUMMARY_REDUCE_PROMPT, max_workers)
+        summary = "\n\n".join(parts)
+    return summary
+
+# --- 토큰 예산 안에서 유지되는 대화 메모리 ---
+MEMORY_TOKEN_BUDGET = 2000
+MEMORY_SUMMARY_TOKENS = 300
+MEMORY_SUMMARY_PROMPT = (
+    "다음은 사용자와 AI의 이전 대화 요약과 그 뒤에 이어진 대화입니다. "
+    "사용자가 다룬 주제, 중요한 사실/결정, 아직 남은 질문이 빠지지 않도록 "
+    "둘을 합쳐 {max_tokens} 토큰 이내의 한국어 요약 하나로 다시 작성하세요.\n\n"
+    "[이전 요약]\n{summary}\n\n[이어진 대화]\n{dialogue}"
+)
+
+class RollingChatMemory:
+    """
+    최근 대화는 그대로, 토큰 예산(max_tokens)을 넘는 오래된 대화는 하나의 요약으로 접어서 유지하는 대화 메모리.
+    요약은 백그라운드 스레드에서 만들기 때문에 응답 경로에는 LLM 호출이 추가되지 않는다.
+    (요약이 끝나기 전까지 예산을 넘는 오래된 대화는 프롬프트에서 빠짐)
+    """
+
+    def __init__(self, max_tokens=MEMORY_TOKEN_BUDGET, summary_tokens=MEMORY_SUMMARY_TOKENS, llm=None):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.llm = llm
+        self.summary = ""
+        self.turns = []   # 아직 요약에 포함되지 않은 대화: [{"user", "assistant", "tokens"}]
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def add_turn(self, user, assistant):
+        turn = {"user": user, "assistant": assistant, "tokens": count_tokens(user) + count_tokens(assistant)}
+        with self._lock:
+            self.turns.append(turn)
+        self._maybe_summarize()
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+
+    def _recent_start(self):
+        # 요약과 함께 예산 안에 들어가는 가장 오래된 대화 위치 (마지막 대화는 항상 포함)
+        budget = self.max_tokens - count_tokens(self.summary)
+        used, start = 0, len(self.turns)
+        for i in range(len(self.turns) - 1, -1, -1):
+            used += self.turns[i]["tokens"]
+            if used > budget and i < len(self.turns) - 1:
+                break
+            start = i
+        return start
+
+    def recent_turns(self):
+        with self._lock:
+            return list(self.turns[self._recent_start():])
+
+    def _maybe_summarize(self):
+        with self._lock:
+            if self._recent_start() == 0 or (self._worker is not None and self._worker.is_alive()):
+                return
+            # 호출한 페이지/세션 정보(telemetry)를 이어받아 백그라운드에서 요약
+            self._worker = threading.Thread(target=contextvars.copy_context().run, args=(self._fold,), daemon=True)
+            self._worker.start()
+
+    def _fold(self):
+        while True:
+            with self._lock:
+                start = self._recent_start()
+                if start == 0:
+                    return
+                summary, folded = self.summary, self.turns[:start]
+            dialogue = "\n".join(f"사용자: {t['user']}\nAI: {t['assistant']}" for t in folded)
+            llm = self.llm or getChatOpenAI("gpt-4o-mini")
+            try:
+                new_summary = llm.predict(MEMORY_SUMMARY_PROMPT.format(
+                    max_tokens=self.summary_tokens, summary=summary or "(없음)", dialogue=dialogue))
+            except Exception:
+                return
+            with self._lock:
+                # 요약하는 동안 clear() 되었으면 버림
+                if self.turns[:len(folded)] != folded:
+                    return
+                self.summary = new_summary.strip()
+                del self.turns[:len(folded)]
+
+    def as_messages(self):
+        """[요약(system), Human, AI, ...] 형태의 LangChain 메시지"""
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        messages = [SystemMessage(content=f"이전 대화 요약:\n{self.summary}")] if self.summary else []
+        for t in self.recent_turns():
+            messages += [HumanMessage(content=t["user"]), AIMessage(content=t["assistant"])]
+        return messages
+
+    def as_text(self):
+        """질문 재구성(condense) 프롬프트 등에 넣을 문자열 형태의 대화 기록"""
+        lines = [f"이전 대화 요약: {self.summary}"] if self.summary else []
+        for t in self.recent_turns():
+            lines += [f"Human: {t['user']}", f"Assistant: {t['assistant']}"]
+        return "\n".join(lines)
+
 def split_docs(documents,chunk_size=1000,chunk_overlap=20):
+  from langchain_text_splitters import RecursiveCharacterTextSplitter
   text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
   docs = text_splitter.split_documents(documents)
   return docs
\ No newline at end of file
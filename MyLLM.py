@@ -1,12 +1,18 @@
 import base64
+import contextvars
+import io
+import re
 import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import google.generativeai as genai
 from dotenv import load_dotenv
 import os
-import streamlit as st
-from openai import OpenAI
+import json
+
+from MyCache import DiskCache, getResponseCache, hash_key, normalize_prompt, response_flight
+from MyRegistry import getGeminiModel, getOpenAIClient
+from MyTelemetry import TimedCall, record_ttft
 
 load_dotenv()
 
@@ -14,9 +20,9 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 #GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
 
+#프로세스 전체에서 공유하는 OpenAI 클라이언트 (연결 풀 재사용)
 def openAiModel():
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    return client
+    return getOpenAIClient()
 
 def makeMsg(system,user ):
     messages = [
@@ -25,26 +31,207 @@ def makeMsg(system,user ):
     ]
     return messages
 
-def openAiModelArg(model, msgs):
+#temperature 0(결정적) 호출만 응답 캐시를 사용. 같은 요청이 동시에 들어오면 한 번만 호출한다.
+def cached_completion(model, temperature, prompt, call):
+    if temperature != 0:
+        return call()
+    store = getResponseCache()
+    key = hash_key(model, temperature, normalize_prompt(prompt))
+    value = store.get(key)
+    if value is not None:
+        return value.decode("utf-8")
+
+    def call_and_store():
+        cached = store.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+        text = call()
+        store.set(key, text.encode("utf-8"))
+        return text
+
+    return response_flight.do(key, call_and_store)
+
+def openAiModelArg(model, msgs, temperature=None):
     print(model)
     print(msgs)
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    response = client.chat.completions.create(
-        model=model,
-        messages=msgs
-    )
-    return response.choices[0].message.content
 
+    def call():
+        client = openAiModel()
+        kwargs = {} if temperature is None else {"temperature": temperature}
+        with TimedCall("llm", model) as telemetry:
+            response = client.chat.completions.create(
+                model=model,
+                messages=msgs,
+                **kwargs
+            )
+            if response.usage:
+                telemetry.input_tokens = response.usage.prompt_tokens
+                telemetry.output_tokens = response.usage.completion_tokens
+        return response.choices[0].message.content
+
+    return cached_completion(model, temperature, json.dumps(msgs, ensure_ascii=False), call)
+
+
+def extract_json_from_text(text):
+    """
+    LLM의 응답에서 JSON 객체를 추출해 파싱 시도.
+    """
+    m = re.search(r'\{.*\}', text, flags=re.S)
+    if m:
+        candidate = m.group(0)
+        try:
+            return json.loads(candidate)
+        except Exception:
+            candidate2 = candidate.replace("'", "\"")
+            try:
+                return json.loads(candidate2)
+            except Exception:
+                return None
+    m2 = re.search(r'\[.*\]', text, flags=re.S)
+    if m2:
+        try:
+            return json.loads(m2.group(0))
+        except Exception:
+            return None
+    return None
+
+def split_into_sentences(text: str) -> list[str]:
+    """
+    간단한 문장 분리기.
+    영어/한국어/일본어 등에서 기본 문장부호로 분리.
+    (정교한 분할이 필요하면 별도 라이브러리 사용 권장)
+    """
+    if not text:
+        return []
+    # 연속 공백 제거
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    # 분할 패턴: 영어/일본어/중국어/한글 문장종결부호 + 공백
+    # 또한 한국어 종결형태(다.|요.|습니다.|습니까.) 뒤 공백도 고려
+    pattern = r'(?<=[\.\?\!。！？\?])\s+|(?<=다\.)\s+|(?<=요\.)\s+|(?<=습니다\.)\s+|(?<=습니까\.)\s+'
+    parts = re.split(pattern, text)
+    # trim and remove empty
+    sentences = [p.strip() for p in parts if p and p.strip()]
+    return sentences
+
+#메시지 목록의 텍스트 부분만 이어 붙임 (이미지 부분은 제외, 토큰 수 추정용)
+def _message_text(msgs):
+    parts = []
+    for m in msgs:
+        content = m.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(p.get("text", "") for p in content if p.get("type") == "text")
+    return "\n".join(parts)
+
+#스트리밍으로 채팅 응답을 받아 텍스트 조각을 하나씩 반환
+#kind 는 사용량 기록용 구분 (이미지가 포함된 요청이면 "vision")
+def stream_chat_completion(model, msgs, temperature=0, response_format=None, kind="llm"):
+    kwargs = {} if response_format is None else {"response_format": response_format}
+    with TimedCall(kind, model) as telemetry:
+        stream = openAiModel().chat.completions.create(
+            model=model,
+            messages=msgs,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},  #마지막 조각에 토큰 사용량이 담겨 옴
+            **kwargs
+        )
+        text = ""
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    telemetry.input_tokens = chunk.usage.prompt_tokens
+                    telemetry.output_tokens = chunk.usage.completion_tokens
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not text:
+                        record_ttft(time.perf_counter() - telemetry.started)
+                    text += delta
+                    yield delta
+        except GeneratorExit:
+            # 소비하는 쪽이 중간에 멈추면(필요한 문항 수를 다 받음 등) 사용량 조각이 오지 않음 → 오류가 아니라 추정치로 기록
+            from MyLCH import count_tokens
+
+            stream.close()
+            telemetry.input_tokens = count_tokens(_message_text(msgs))
+            telemetry.output_tokens = count_tokens(text)
+
+def iter_json_array_items(chunks):
+    """
+    스트리밍으로 들어오는 JSON 텍스트 조각에서, 처음 나오는 배열의 원소(객체)가
+    완성되는 대로 하나씩 파싱해 반환한다. 파싱에 실패한 원소는 건너뛴다.
+    예) '{"questions": [{...}, {...}]}' → {...}, {...}
+    """
+    buf = ""
+    pos = 0
+    depth = 0
+    in_str = False
+    escaped = False
+    array_depth = None
+    item_start = None
+    for chunk in chunks:
+        buf += chunk
+        while pos < len(buf):
+            c = buf[pos]
+            if in_str:
+                if escaped:
+                    escaped = False
+                elif c == "\\":
+                    escaped = True
+                elif c == '"':
+                    in_str = False
+            elif c == '"':
+                in_str = True
+            elif c in "[{":
+                depth += 1
+                if array_depth is None and c == "[":
+                    array_depth = depth
+                elif array_depth is not None and c == "{" and depth == array_depth + 1:
+                    item_start = pos
+            elif c in "]}":
+                if c == "}" and item_start is not None and depth == array_depth + 1:
+                    try:
+                        yield json.loads(buf[item_start:pos + 1])
+                    except ValueError:
+                        pass
+                    item_start = None
+                elif c == "]" and depth == array_depth:
+                    return
+                depth -= 1
+            pos += 1
+
+#서로 독립적인 작업들을 스레드 풀에서 동시에 실행하고, 끝나는 순서대로 (이름, 결과, 오류)를 반환
+#tasks: {이름: 인자 없는 함수}. 작업 안에서는 Streamlit 화면 함수를 호출하지 않는다.
+def run_parallel(tasks, max_workers=None):
+    if not tasks:
+        return
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(tasks), 8)) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, fn): name for name, fn in tasks.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                yield name, future.result(), None
+            except Exception as e:
+                yield name, None, e
 
 def geminiModel():
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    return model
+    return getGeminiModel("gemini-2.0-flash")
 
-def geminiTxt(txt):
-    model = geminiModel()
-    response = model.generate_content(txt)
-    return response.text
+def geminiTxt(txt, temperature=None):
+    def call():
+        model = geminiModel()
+        config = None if temperature is None else {"temperature": temperature}
+        with TimedCall("llm", "gemini-2.0-flash") as telemetry:
+            response = model.generate_content(txt, generation_config=config)
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                telemetry.input_tokens = usage.prompt_token_count
+                telemetry.output_tokens = usage.candidates_token_count
+        return response.text
+
+    return cached_completion("gemini-2.0-flash", temperature, txt, call)
 
 def save_carpturefile(directory, picture, name, st):
     if picture is not None:
@@ -67,31 +254,227 @@ def save_uploadedfile(directory, file, st):
     st.success(f'저장 완료: {directory}에 {file.name} 저장되었습니다.')
 
 
-def progressBar(txt):
-    # Progress Bar Start -----------------------------------------
-    progress_text = txt
-    my_bar = st.progress(0, text=progress_text)
-    for percent_complete in range(100):
-        time.sleep(0.08)
-        my_bar.progress(percent_complete + 1, text=progress_text)
-    time.sleep(1)
-    return my_bar
-    # Progress Bar End -----------------------------------------
-
-def makeAudio(text, name):
-    if not os.path.exists("audio"):
-        os.makedirs("audio")
-    model = openAiModel()
-    response = model.audio.speech.create(
-        model="tts-1",
-        input=text,
-        #["alloy", "echo", "fable", "onyx", "nova", "shimmer"],
-        voice="echo",
-        response_format="mp3",
-        speed=1.2,
-    )
-    response.stream_to_file("audio/"+name)
+# --- TTS ---
+TTS_MODEL = "tts-1"
+TTS_VOICE = "echo"   #["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
+TTS_SPEED = 1.2
+TTS_MAX_INPUT_CHARS = 4000   # API 입력 제한(4096자)보다 약간 작게
+TTS_SEGMENT_CHARS = 300      # 두 번째 구간부터 한 번에 합성할 글자 수 (첫 구간은 첫 문장만)
+TTS_WORKERS = 4
+_SENTENCE_END = re.compile(r'[\.\?\!。！？]\s+')
+_tts_cache = None
+
+def getTTSCache():
+    # (모델, 목소리, 속도, 문장) 별 mp3. 크기를 넘으면 오래 안 쓴 것부터 삭제
+    global _tts_cache
+    if _tts_cache is None:
+        _tts_cache = DiskCache("tts", max_bytes=256 * 1024 * 1024, ttl=30 * 24 * 3600)
+    return _tts_cache
+
+def synthesize_speech(text, voice=TTS_VOICE, speed=TTS_SPEED):
+    """텍스트 한 구간을 mp3 bytes 로 합성 (같은 구간은 캐시 재사용)"""
+    store = getTTSCache()
+    key = hash_key(TTS_MODEL, voice, speed, text)
+    audio = store.get(key)
+    if audio is not None:
+        return audio
+    with TimedCall("tts", TTS_MODEL) as telemetry:
+        telemetry.units = len(text)
+        response = openAiModel().audio.speech.create(
+            model=TTS_MODEL,
+            input=text,
+            voice=voice,
+            response_format="mp3",
+            speed=speed,
+        )
+        audio = response.content
+    store.set(key, audio)
+    return audio
+
+class SpeechPipeline:
+    """
+    스트리밍으로 받는 답변을 문장 단위로 끊어 받는 즉시 병렬로 음성 합성.
+    첫 구간은 첫 문장만 보내 빨리 끝나게 하고, 이후는 TTS_SEGMENT_CHARS 정도로 묶는다.
+    답변이 끝났을 때는 마지막 구간 하나만 합성을 기다리면 된다.
+    """
+
+    def __init__(self, voice=TTS_VOICE, speed=TTS_SPEED, max_workers=TTS_WORKERS):
+        self.voice = voice
+        self.speed = speed
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = []
+        self.buffer = ""
+        self.group = ""
+
+    def _submit(self, text):
+        # 입력 제한보다 긴 구간은 잘라서 보냄
+        for i in range(0, len(text), TTS_MAX_INPUT_CHARS):
+            ctx = contextvars.copy_context()
+            self.futures.append(self.pool.submit(ctx.run, synthesize_speech, text[i:i + TTS_MAX_INPUT_CHARS], self.voice, self.speed))
+
+    def _add_sentences(self, text):
+        for sentence in split_into_sentences(text):
+            self.group = f"{self.group} {sentence}".strip()
+            if not self.futures or len(self.group) >= TTS_SEGMENT_CHARS:
+                self._submit(self.group)
+                self.group = ""
+
+    def feed(self, delta):
+        """스트리밍 조각을 추가. 끝난 문장이 생기면 합성을 시작한다"""
+        self.buffer += delta
+        last = None
+        for last in _SENTENCE_END.finditer(self.buffer):
+            pass
+        if last is not None:
+            self._add_sentences(self.buffer[:last.end()])
+            self.buffer = self.buffer[last.end():]
+
+    def finish(self):
+        """남은 텍스트까지 합성하고 구간별 mp3 bytes 를 순서대로 반환"""
+        self._add_sentences(self.buffer)
+        self.buffer = ""
+        if self.group:
+            self._submit(self.group)
+            self.group = ""
+        try:
+            return [f.result() for f in self.futures]
+        finally:
+            self.close()
+
+    def close(self):
+        """아직 시작하지 않은 합성은 취소하고 스레드 풀을 정리 (스트리밍 도중 오류가 나도 호출)"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def save(self, name):
+        """합성한 구간을 이어 붙여 audio/name 에 저장 (mp3 프레임은 그대로 이어 재생 가능)"""
+        os.makedirs("audio", exist_ok=True)
+        path = os.path.join("audio", name)
+        with open(path, "wb") as f:
+            for audio in self.finish():
+                f.write(audio)
+        return path
+
+def makeAudio(text, name, voice=TTS_VOICE, speed=TTS_SPEED):
+    with SpeechPipeline(voice, speed) as speech:
+        speech.feed(text)
+        return speech.save(name)
+
+
+# --- Whisper 전사 ---
+WHISPER_MAX_BYTES = 24 * 1024 * 1024   # API 업로드 제한(25MB)보다 약간 작게
+SEGMENT_MS = 5 * 60 * 1000             # 분할 구간 길이 목표
+SEGMENT_OVERLAP_MS = 2000              # 구간 경계에서 겹치는 길이
+BOUNDARY_SEARCH_MS = 20 * 1000         # 경계 앞쪽에서 가장 조용한 지점을 찾는 범위
+FRAME_MS = 250
+
+def transcribe_audio(file, model="whisper-1", seconds=0.0):
+    """파일(경로 또는 (이름, bytes))을 한 번의 요청으로 전사. seconds 는 사용량 기록용 오디오 길이"""
+    client = openAiModel()
+    with TimedCall("whisper", model) as telemetry:
+        telemetry.units = seconds
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as f:
+                resp = client.audio.transcriptions.create(file=f, model=model)
+        else:
+            resp = client.audio.transcriptions.create(file=file, model=model)
+    if isinstance(resp, dict):
+        return resp.get("text")
+    return getattr(resp, "text", None)
+
+def find_split_points(audio, segment_ms=SEGMENT_MS, search_ms=BOUNDARY_SEARCH_MS):
+    """segment_ms 마다, 그 직전 search_ms 안에서 가장 에너지가 낮은(조용한) 지점을 경계로 선택"""
+    points = []
+    target = segment_ms
+    while target < len(audio) - search_ms:
+        best_pos, best_rms = target, None
+        for pos in range(target - search_ms, target, FRAME_MS):
+            rms = audio[pos:pos + FRAME_MS].rms
+            if best_rms is None or rms < best_rms:
+                best_pos, best_rms = pos + FRAME_MS // 2, rms
+        points.append(best_pos)
+        target = best_pos + segment_ms
+    return points
+
+def _words(text):
+    return [re.sub(r"[^\w]", "", w).lower() for w in text.split()]
+
+def merge_overlap(prev_text, next_text, max_words=30):
+    """겹치는 구간 때문에 앞 구간 끝과 다음 구간 시작에 중복된 단어를 제거하고 이어붙임"""
+    if not prev_text:
+        return next_text or ""
+    if not next_text:
+        return prev_text
+    prev_words, next_words = _words(prev_text), _words(next_text)
+    overlap = 0
+    for k in range(min(max_words, len(prev_words), len(next_words)), 0, -1):
+        if prev_words[-k:] == next_words[:k]:
+            overlap = k
+            break
+    rest = next_text.split()[overlap:]
+    return prev_text + (" " + " ".join(rest) if rest else "")
+
+def transcribe_long_audio(path, max_workers=4, on_progress=None):
+    """
+    긴 녹음을 조용한 지점 기준으로 겹치게 분할하여 동시에 전사하고, 순서대로 이어붙여 반환.
+    on_progress(완료 구간 수, 전체 구간 수)는 호출한 스레드에서 불린다.
+    """
+    path = str(path)
+    # 긴 녹음 분할용 (ffmpeg 필요). pydub/ffmpeg 가 없거나 디코딩하지 못하면 파일 전체를 한 번에 전사
+    try:
+        from pydub import AudioSegment
+        from pydub.exceptions import CouldntDecodeError
+    except ImportError:
+        AudioSegment = None
+    audio = None
+    if AudioSegment is not None:
+        try:
+            # 전사에는 16kHz 모노면 충분하므로 디코딩 직후 줄여서 보관
+            # (44.1kHz 스테레오 PCM 은 90분에 약 1GB, 16kHz 모노는 약 170MB)
+            audio = AudioSegment.from_file(path).set_channels(1).set_frame_rate(16000)
+        except (OSError, CouldntDecodeError):
+            audio = None
+    if audio is None and os.path.getsize(path) > WHISPER_MAX_BYTES:
+        raise RuntimeError("파일이 커서 나누어 전사해야 하지만 오디오를 디코딩하지 못했습니다. ffmpeg 설치를 확인하세요.")
+    if audio is None or (len(audio) <= SEGMENT_MS and os.path.getsize(path) <= WHISPER_MAX_BYTES):
+        if on_progress:
+            on_progress(0, 1)
+        text = transcribe_audio(path, seconds=len(audio) / 1000 if audio is not None else 0.0)
+        if on_progress:
+            on_progress(1, 1)
+        return text
+
+    bounds = [0] + find_split_points(audio) + [len(audio)]
+    segments = []
+    for i in range(len(bounds) - 1):
+        start = max(0, bounds[i] - SEGMENT_OVERLAP_MS) if i else 0
+        buf = io.BytesIO()
+        audio[start:bounds[i + 1]].export(buf, format="mp3", bitrate="64k")
+        segments.append(((f"segment_{i}.mp3", buf.getvalue()), (bounds[i + 1] - start) / 1000))
+    del audio
+
+    results = [None] * len(segments)
+    tasks = {i: (lambda seg=seg, sec=sec: transcribe_audio(seg, seconds=sec)) for i, (seg, sec) in enumerate(segments)}
+    done = 0
+    if on_progress:
+        on_progress(done, len(segments))
+    for i, text, error in run_parallel(tasks, max_workers=max_workers):
+        if error is not None:
+            raise error
+        results[i] = text or ""
+        done += 1
+        if on_progress:
+            on_progress(done, len(segments))
 
+    transcript = ""
+    for text in results:
+        transcript = merge_overlap(transcript, text)
+    return transcript
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
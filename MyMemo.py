@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+MEMO_DB_PATH = os.getenv("MEMO_DB_PATH", os.path.join("data", "memos.sqlite3"))
+
+
+class MemoStore:
+    """
+    사용자별 달력 메모를 SQLite에 저장한다.
+    (user, date) 인덱스로 날짜 범위 조회가 메모 개수와 무관하게 빠르게 동작한다.
+    """
+
+    def __init__(self, path=MEMO_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memos ("
+            " id TEXT PRIMARY KEY,"
+            " user TEXT NOT NULL,"
+            " date TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memos_user_date ON memos(user, date)")
+        self._conn.commit()
+
+    def add(self, user, date, content):
+        memo_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO memos(id, user, date, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (memo_id, user, str(date), content, time.time()),
+            )
+            self._conn.commit()
+        return memo_id
+
+    def delete(self, user, memo_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM memos WHERE user=? AND id=?", (user, memo_id))
+            self._conn.commit()
+
+    def list(self, user, start=None, end=None, limit=None, newest_first=False):
+        """사용자의 메모 목록 (start~end 날짜 범위, 양 끝 포함)"""
+        sql = "SELECT id, date, content FROM memos WHERE user=?"
+        args = [user]
+        if start is not None:
+            sql += " AND date >= ?"
+            args.append(str(start))
+        if end is not None:
+            sql += " AND date <= ?"
+            args.append(str(end))
+        sql += " ORDER BY date DESC, created_at DESC" if newest_first else " ORDER BY date, created_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [dict(row) for row in rows]
+
+    def ids(self, user, start=None, end=None):
+        """날짜 범위(양 끝 포함)에 있는 메모 id 목록 (본문은 읽지 않음)"""
+        sql = "SELECT id FROM memos WHERE user=?"
+        args = [user]
+        if start is not None:
+            sql += " AND date >= ?"
+            args.append(str(start))
+        if end is not None:
+            sql += " AND date <= ?"
+            args.append(str(end))
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, args)]
+
+    def get_many(self, user, ids):
+        """id 목록에 해당하는 메모 (없는 id 는 빠짐)"""
+        rows = []
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = list(ids[i:i + 500])
+                marks = ",".join("?" * len(batch))
+                rows += self._conn.execute(
+                    f"SELECT id, date, content FROM memos WHERE user=? AND id IN ({marks})", [user] + batch
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, user, start=None, end=None):
+        sql = "SELECT COUNT(*) FROM memos WHERE user=?"
+        args = [user]
+        if start is not None:
+            sql += " AND date >= ?"
+            args.append(str(start))
+        if end is not None:
+            sql += " AND date <= ?"
+            args.append(str(end))
+        with self._lock:
+            return self._conn.execute(sql, args).fetchone()[0]
+
+
+_memo_store = None
+
+
+def getMemoStore():
+    global _memo_store
+    if _memo_store is None:
+        _memo_store = MemoStore()
+    return _memo_store
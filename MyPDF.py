@@ -0,0 +1,76 @@
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+# 이 페이지 수 이상이면 여러 프로세스로 나누어 추출
+PARALLEL_MIN_PAGES = 40
+# 프로세스 하나가 한 번에 처리하는 페이지 수
+PAGES_PER_TASK = 16
+
+_worker_reader = None
+
+
+def _init_worker(data):
+    # 워커 프로세스마다 PDF를 한 번만 연다
+    global _worker_reader
+    _worker_reader = PdfReader(io.BytesIO(data))
+
+
+def _extract_range(start, end):
+    return [(i + 1, _worker_reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def _read_bytes(pdf):
+    if isinstance(pdf, bytes):
+        return pdf
+    if hasattr(pdf, "getvalue"):
+        return pdf.getvalue()
+    with open(pdf, "rb") as f:
+        return f.read()
+
+
+def iter_pdf_pages(pdf, max_workers=None):
+    """
+    PDF의 각 페이지 텍스트를 (페이지 번호, 텍스트) 형태로 순서대로 하나씩 반환하는 제너레이터.
+    페이지가 많으면 프로세스 풀로 나누어 추출하되, 동시에 처리 중인 묶음 수를 제한해
+    최대 메모리 사용량을 일정하게 유지한다.
+    """
+    data = _read_bytes(pdf)
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    workers = max_workers or min(os.cpu_count() or 1, 8)
+
+    if total < PARALLEL_MIN_PAGES or workers <= 1:
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page.extract_text() or ""
+        return
+
+    del reader
+    ranges = deque((s, min(s + PAGES_PER_TASK, total)) for s in range(0, total, PAGES_PER_TASK))
+    # 스레드가 많은 Streamlit 서버에서 fork 하면 다른 스레드가 잡고 있던 락(sqlite, httpx 등) 때문에
+    # 자식이 멈출 수 있으므로 spawn 사용 (PDF 바이트는 initargs 로 전달)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(data,)) as pool:
+        pending = deque()
+        try:
+            while ranges or pending:
+                # 처리 중인 묶음은 워커 수의 2배까지만 유지
+                while ranges and len(pending) < workers * 2:
+                    pending.append(pool.submit(_extract_range, *ranges.popleft()))
+                for page_no, text in pending.popleft().result():
+                    yield page_no, text
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def iter_pdf_documents(pdf_docs, max_workers=None):
+    """여러 PDF의 페이지를 {"source", "page", "text"} 형태로 순서대로 반환"""
+    for pdf in pdf_docs:
+        source = getattr(pdf, "name", None) or (pdf if isinstance(pdf, str) else "")
+        for page_no, text in iter_pdf_pages(pdf, max_workers=max_workers):
+            yield {"source": source, "page": page_no, "text": text}
@@ -0,0 +1,82 @@
+import streamlit as st
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class StageProgress:
+    """
+    실제 작업 단계에 맞춰 진행률을 표시하는 진행 표시줄.
+    stages: [(단계 이름, 표시 문구, 비중), ...]  — 비중의 합 기준으로 진행률을 나눈다.
+
+        with StageProgress([("encode", "이미지 인코딩", 1), ("request", "요청 전송", 1)]) as progress:
+            progress.stage("encode")
+            ...
+            progress.advance(0.5)   # 현재 단계의 50%
+    """
+
+    def __init__(self, stages, container=None):
+        self.stages = stages
+        self.container = container or st
+        self.total = float(sum(weight for _, _, weight in stages)) or 1.0
+        self.current = None
+        self.label = ""
+        self.bar = None
+
+    def __enter__(self):
+        self.bar = self.container.progress(0, text=self.stages[0][1] if self.stages else "")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.bar.empty()
+        return False
+
+    def _offset(self, name):
+        offset = 0
+        for stage_name, label, weight in self.stages:
+            if stage_name == name:
+                return offset, label, weight
+            offset += weight
+        raise KeyError(name)
+
+    def stage(self, name, label=None):
+        """단계 시작: 이전 단계들은 완료된 것으로 표시"""
+        self.current = name
+        offset, default_label, _ = self._offset(name)
+        self.label = label or default_label
+        self.bar.progress(min(offset / self.total, 1.0), text=self.label)
+
+    def advance(self, fraction, label=None):
+        """현재 단계 안에서 진행률(0~1) 갱신"""
+        if self.current is None:
+            return
+        offset, _, weight = self._offset(self.current)
+        if label:
+            self.label = label
+        fraction = max(0.0, min(fraction, 1.0))
+        self.bar.progress(min((offset + weight * fraction) / self.total, 1.0), text=self.label)
+
+
+class ProgressCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain LLM 호출의 실제 진행(요청 전송 → 토큰 수신 → 완료)에 맞춰 StageProgress를 갱신하는 콜백.
+    토큰 수신 단계는 expected_tokens 기준으로 진행률을 추정한다.
+    """
+
+    def __init__(self, progress, request_stage="request", tokens_stage="tokens", expected_tokens=400):
+        self.progress = progress
+        self.request_stage = request_stage
+        self.tokens_stage = tokens_stage
+        self.expected_tokens = expected_tokens
+        self.tokens = 0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.progress.stage(self.request_stage)
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.tokens == 0:
+            self.progress.stage(self.tokens_stage)
+        self.tokens += 1
+        self.progress.advance(min(self.tokens / self.expected_tokens, 0.95))
+
+    def on_llm_end(self, response, **kwargs):
+        self.progress.stage(self.tokens_stage)
+        self.progress.advance(1.0)
@@ -0,0 +1,257 @@
+import contextvars
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from array import array
+
+from MyCache import CACHE_DIR
+from MyLCH import getEmbeddings, pack_documents
+from MyLLM import iter_json_array_items, makeMsg, stream_chat_completion
+
+QBANK_DB_PATH = os.path.join(CACHE_DIR, "qbank.sqlite3")
+# 문서/난이도마다 미리 만들어 둘 (아직 출제되지 않은) 문항 수
+BANK_TARGET = 12
+# 한 번에 미리 생성하는 문항 수
+BANK_BATCH = 4
+# 이 값 이상으로 비슷한(코사인 유사도) 문항은 중복으로 보고 버림
+DEDUP_THRESHOLD = 0.92
+
+# 응답 형식을 모델 단에서 강제하는 JSON 스키마 (문항 배열)
+MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "choices": {"type": "array", "items": {"type": "string"}},
+                    "answer": {"type": "integer"},
+                    "explanation": {"type": "string"},
+                },
+                "required": ["question", "choices", "answer", "explanation"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["questions"],
+    "additionalProperties": False,
+}
+MCQ_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "mcq_set", "strict": True, "schema": MCQ_SCHEMA}}
+# 유효하지 않은 문항만 다시 요청하는 최대 횟수
+MCQ_MAX_ATTEMPTS = 3
+
+def build_mcq_query(n, difficulty, choices_count=4, avoid=()):
+    query = (
+        f"업로드된 PDF 내용을 바탕으로 **객관식(선다형) {n}문항**을 만들어주세요. "
+        f"난이도는 '{difficulty}'로 해주세요. (easy/medium/hard의 의미에 맞게 출제)\n"
+        "각 문항은 다음 필드를 가집니다:\n\n"
+        " - question: (문항 text, 한국어)\n"
+        f" - choices: (선택지 리스트, 길이 {choices_count}, 한국어)\n"
+        " - answer: (정답 인덱스: 0부터 시작하는 정수)\n"
+        " - explanation: (정답 해설/설명, 한국어)\n"
+    )
+    if avoid:
+        query += "\n다음 문항과 겹치지 않게 출제하세요:\n" + "\n".join(f"- {q}" for q in avoid)
+    return query
+
+def validate_mcq(q, choices_count=4):
+    """문항 하나를 검사하고, 문제가 있으면 이유를, 없으면 None 반환"""
+    if not isinstance(q, dict) or not all(k in q for k in ("question", "choices", "answer", "explanation")):
+        return "필수 필드가 없습니다."
+    if not isinstance(q['choices'], list) or len(q['choices']) != choices_count:
+        return f"선택지가 {choices_count}개가 아닙니다."
+    if not isinstance(q['answer'], int) or not 0 <= q['answer'] < choices_count:
+        return f"정답 인덱스가 올바르지 않습니다: {q.get('answer')}"
+    return None
+
+def get_mcq_context(vectorstore, sample=False):
+    """
+    문제 출제에 쓸 자료를 토큰 예산 안에서 만든다.
+    sample=True 이면 문서 전체에서 무작위로 청크를 골라 매번 다른 범위에서 출제되도록 한다.
+    """
+    if sample:
+        docs = list(vectorstore.docstore._dict.values())
+        random.shuffle(docs)
+        docs = pack_documents(docs[:40])
+    else:
+        # 관련도 순으로 넉넉히 찾은 뒤 토큰 예산 안에서만 컨텍스트에 넣음
+        docs = pack_documents(vectorstore.similarity_search("핵심 개념 요약", k=12))
+    return "\n\n".join(d.page_content for d in docs)
+
+def collect_mcq(vectorstore, n, difficulty, choices_count=4, on_item=None, avoid=(), sample=False, temperature=0):
+    """
+    구조화된 출력(JSON 스키마)을 스트리밍으로 받아, 문항이 완성되는 대로 검사해 모은다.
+    유효하지 않은 문항은 버리고 모자란 개수만 다시 요청한다.
+    on_item(문항)은 유효한 문항이 하나 완성될 때마다 호출된다. (없으면 화면 출력 없음)
+    """
+    context = get_mcq_context(vectorstore, sample=sample)
+    questions = []
+    for _ in range(MCQ_MAX_ATTEMPTS):
+        need = n - len(questions)
+        if need <= 0:
+            break
+        msgs = makeMsg(
+            "당신은 학습 자료로 객관식 문제를 출제하는 선생님입니다. 아래 자료의 내용만 사용하세요.\n\n"
+            f"자료:\n{context}",
+            build_mcq_query(need, difficulty, choices_count, avoid=list(avoid) + [q['question'] for q in questions]),
+        )
+        chunks = stream_chat_completion("gpt-4o", msgs, temperature=temperature, response_format=MCQ_RESPONSE_FORMAT)
+        for q in iter_json_array_items(chunks):
+            if validate_mcq(q, choices_count) is not None:
+                continue
+            questions.append(q)
+            if on_item:
+                on_item(q)
+            if len(questions) >= n:
+                break
+    return questions
+
+
+def _to_blob(vec):
+    return array("f", vec).tobytes()
+
+
+def _from_blob(blob):
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    na = sum(x * x for x in a) ** 0.5
+    nb = sum(y * y for y in b) ** 0.5
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class QuestionBank:
+    """
+    문서 다이제스트와 난이도별로 미리 생성한 객관식 문항을 저장하는 문제 은행.
+    의미가 거의 같은 문항은 저장하지 않고, 꺼낸 문항은 출제됨(served)으로 표시한다.
+    """
+
+    def __init__(self, path=QBANK_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " digest TEXT NOT NULL,"
+            " difficulty TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " embedding BLOB NOT NULL,"
+            " embedding_tag TEXT NOT NULL DEFAULT '',"
+            " served INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(questions)")]
+        if "embedding_tag" not in columns:
+            self._conn.execute("ALTER TABLE questions ADD COLUMN embedding_tag TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_doc ON questions(digest, difficulty, served)")
+        self._conn.commit()
+
+    def available(self, digest, difficulty):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE digest=? AND difficulty=? AND served=0", (digest, difficulty)
+            ).fetchone()[0]
+
+    def recent_questions(self, digest, difficulty, limit=30):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM questions WHERE digest=? AND difficulty=? ORDER BY id DESC LIMIT ?",
+                (digest, difficulty, limit),
+            ).fetchall()
+        return [json.loads(row[0])["question"] for row in rows]
+
+    def add(self, digest, difficulty, questions, served=False):
+        """의미상 중복이 아닌 문항만 저장하고, 저장된 개수를 반환"""
+        if not questions:
+            return 0
+        embeddings = getEmbeddings()
+        vectors = embeddings.embed_documents([q["question"] for q in questions])
+        with self._lock:
+            # 같은 임베딩 제공자로 만든 벡터끼리만 비교
+            existing = [_from_blob(row[0]) for row in self._conn.execute(
+                "SELECT embedding FROM questions WHERE digest=? AND difficulty=? AND embedding_tag=?",
+                (digest, difficulty, embeddings.tag),
+            )]
+            added = 0
+            for q, vec in zip(questions, vectors):
+                if any(_cosine(vec, other) >= DEDUP_THRESHOLD for other in existing):
+                    continue
+                self._conn.execute(
+                    "INSERT INTO questions(digest, difficulty, data, embedding, embedding_tag, served, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (digest, difficulty, json.dumps(q, ensure_ascii=False), _to_blob(vec), embeddings.tag,
+                     int(served), time.time()),
+                )
+                existing.append(vec)
+                added += 1
+            self._conn.commit()
+        return added
+
+    def take(self, digest, difficulty, n):
+        """아직 출제되지 않은 문항을 오래된 순으로 n개 꺼냄"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM questions WHERE digest=? AND difficulty=? AND served=0 ORDER BY id LIMIT ?",
+                (digest, difficulty, n),
+            ).fetchall()
+            self._conn.executemany("UPDATE questions SET served=1 WHERE id=?", [(row[0],) for row in rows])
+            self._conn.commit()
+        return [json.loads(row[1]) for row in rows]
+
+
+_question_bank = None
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def getQuestionBank():
+    global _question_bank
+    if _question_bank is None:
+        _question_bank = QuestionBank()
+    return _question_bank
+
+
+def _fill_bank(digest, difficulty, vectorstore, target, choices_count):
+    bank = getQuestionBank()
+    for _ in range(target):  # 중복만 계속 나오는 경우를 대비해 시도 횟수 제한
+        need = target - bank.available(digest, difficulty)
+        if need <= 0:
+            break
+        try:
+            questions = collect_mcq(
+                vectorstore, min(need, BANK_BATCH), difficulty, choices_count,
+                avoid=bank.recent_questions(digest, difficulty), sample=True, temperature=0.7,
+            )
+        except Exception as e:
+            print(f"문제 은행 생성 실패 ({digest[:8]}, {difficulty}): {e}")
+            break
+        bank.add(digest, difficulty, questions)
+
+
+def ensure_filled(digest, difficulty, vectorstore, target=BANK_TARGET, choices_count=4):
+    """문제 은행이 target 개보다 적으면 백그라운드 스레드에서 채운다 (문서/난이도당 스레드 하나)"""
+    if getQuestionBank().available(digest, difficulty) >= target:
+        return
+    key = (digest, difficulty)
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is not None and worker.is_alive():
+            return
+        # 호출한 페이지/세션 정보(telemetry)를 백그라운드 스레드에도 이어받음
+        worker = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(_fill_bank, digest, difficulty, vectorstore, target, choices_count),
+            daemon=True,
+        )
+        _workers[key] = worker
+        worker.start()
@@ -0,0 +1,69 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# 공유 HTTP 연결 풀 크기와 유휴 연결 유지 시간(초)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_KEEPALIVE_SECONDS = 120
+
+_registry = {}
+# 생성 함수 안에서 다른 공유 객체를 가져올 수 있도록 RLock 사용
+_lock = threading.RLock()
+
+
+# 무거운 SDK(openai, httpx, google.generativeai)는 처음 클라이언트를 만들 때 import 한다.
+def get_shared(key, factory):
+    """
+    프로세스 전체에서 key 당 한 번만 factory()를 실행하고 그 객체를 재사용한다.
+    Streamlit 페이지 스크립트는 매 rerun 마다 다시 실행되므로, 클라이언트/모델은 여기서 가져온다.
+    """
+    obj = _registry.get(key)
+    if obj is None:
+        with _lock:
+            obj = _registry.get(key)
+            if obj is None:
+                obj = _registry[key] = factory()
+    return obj
+
+
+def registry_keys():
+    return list(_registry)
+
+
+def getHttpClient():
+    """OpenAI 호출이 함께 쓰는 keep-alive 연결 풀"""
+    import httpx
+
+    return get_shared("http_client", lambda: httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(600, connect=10),
+    ))
+
+
+def getOpenAIClient():
+    """공유 OpenAI SDK 클라이언트 (스레드 안전, 연결 풀 공유)"""
+    from openai import OpenAI
+
+    return get_shared("openai_client", lambda: OpenAI(api_key=OPENAI_API_KEY, http_client=getHttpClient()))
+
+
+def getGeminiModel(model="gemini-2.0-flash"):
+    """genai.configure 는 프로세스에서 한 번만 호출하고, 모델 객체는 이름별로 재사용"""
+    import google.generativeai as genai
+
+    def configure():
+        genai.configure(api_key=GOOGLE_API_KEY)
+        return True
+
+    get_shared("genai", configure)
+    return get_shared(("gemini", model), lambda: genai.GenerativeModel(model))
@@ -0,0 +1,154 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# 한국어 어절 끝에서 떼어낼 조사/어미 (긴 것부터 검사)
+KOREAN_SUFFIXES = sorted([
+    "은", "는", "이", "가", "을", "를", "의", "에", "에서", "에게", "께서", "한테", "으로", "로",
+    "와", "과", "도", "만", "까지", "부터", "보다", "처럼", "이다", "입니다", "이며", "이고", "하는", "한다",
+], key=len, reverse=True)
+
+# 한글 이외의 문자/숫자(그리스 문자, 악센트 문자, 위첨자 등 포함)는 [^\W_가-힣] 로 받음
+_TOKEN_RE = re.compile(r"[가-힣]+|[^\W_가-힣]+(?:[._\-^/][^\W_가-힣]+)*|[^\s\w]")
+
+# 로컬 재정렬(flashrank) 사용 여부와, 재정렬할 후보 수
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+RERANK_CANDIDATES = 20
+
+
+def tokenize(text):
+    """
+    BM25용 토큰화.
+    - 영문/숫자(그리스 문자, 악센트 문자 포함): 소문자 단어 (a.b, x^2, f(x)의 x 처럼 공식 조각은 기호로 연결된 채 유지)
+    - 한글: 어절 + 조사를 뗀 어간 + 음절 bigram (띄어쓰기/조사 차이에도 매칭되도록)
+    - 기타 기호(=, +, ∑ 등)는 한 글자 토큰
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if "가" <= token[0] <= "힣":
+            tokens.append(token)
+            for suffix in KOREAN_SUFFIXES:
+                if len(token) > len(suffix) and token.endswith(suffix):
+                    tokens.append(token[:-len(suffix)])
+                    break
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """메모리 안의 역색인으로 BM25 점수를 계산하는 키워드 검색기"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)   # 토큰 -> {문서 번호: 빈도}
+        self.lengths = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                self.postings[token][i] = tf
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(self.lengths)
+        self.idf = {
+            token: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self.postings.items()
+        }
+
+    def search(self, query, k=10):
+        """[(문서 번호, 점수), ...] 점수 내림차순"""
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            docs = self.postings.get(token)
+            if not docs:
+                continue
+            idf = self.idf[token]
+            for i, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1.0))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """여러 순위 목록(키 리스트)을 RRF 점수로 합쳐 하나의 순위로 만든다"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+_reranker = None
+
+
+def getReranker():
+    """flashrank가 설치되어 있고 RERANK=1 이면 로컬 재정렬 모델, 아니면 None"""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        try:
+            from flashrank import Ranker
+        except ImportError:
+            return None
+        _reranker = Ranker()
+    return _reranker
+
+
+def rerank(query, docs, reranker):
+    from flashrank import RerankRequest
+
+    passages = [{"id": i, "text": d.page_content} for i, d in enumerate(docs)]
+    results = reranker.rerank(RerankRequest(query=query, passages=passages))
+    return [docs[r["id"]] for r in results]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    FAISS 벡터 검색과 BM25 키워드 검색 결과를 RRF로 합치는 검색기.
+    용어/공식/고유명사처럼 임베딩이 놓치기 쉬운 정확한 일치를 함께 찾는다.
+    reranker가 있으면 합친 상위 후보를 로컬에서 다시 정렬한 뒤 k개를 반환한다.
+    """
+
+    vectorstore: Any
+    documents: List[Document]
+    bm25: Any
+    k: int = 12
+    fetch_k: int = 30
+    rrf_k: int = 60
+    reranker: Optional[Any] = None
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, **kwargs):
+        # FAISS docstore에 들어 있는 청크로 BM25 색인을 만듦 (임베딩 재계산 없음)
+        documents = [vectorstore.docstore.search(i) for i in vectorstore.index_to_docstore_id.values()]
+        documents = [d for d in documents if isinstance(d, Document)]
+        bm25 = BM25Index([d.page_content for d in documents])
+        kwargs.setdefault("reranker", getReranker())
+        return cls(vectorstore=vectorstore, documents=documents, bm25=bm25, **kwargs)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        keyword_docs = [self.documents[i] for i, _ in self.bm25.search(query, k=self.fetch_k)]
+        by_text = {}
+        for d in vector_docs + keyword_docs:
+            by_text.setdefault(d.page_content, d)
+        fused = reciprocal_rank_fusion(
+            [[d.page_content for d in vector_docs], [d.page_content for d in keyword_docs]], k=self.rrf_k
+        )
+        docs = [by_text[text] for text in fused]
+        if self.reranker is not None:
+            candidates = docs[:max(self.k, RERANK_CANDIDATES)]
+            try:
+                docs = rerank(query, candidates, self.reranker)
+            except Exception:
+                docs = candidates
+        return docs[:self.k]
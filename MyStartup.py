@@ -0,0 +1,62 @@
+import builtins
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# 최상위 패키지별 import 시간(초, 자기 자신에게 걸린 시간만. 하위 import 시간은 해당 패키지로 집계)
+IMPORT_TIMES = defaultdict(float)
+PROCESS_STARTED = time.time()
+
+_original_import = builtins.__import__
+_local = threading.local()
+_installed = False
+_reported = False
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # 이미 로드된 모듈과 상대 import 는 그대로 통과 (측정 비용 없음)
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = stack.pop()
+        IMPORT_TIMES[name.split(".")[0]] += elapsed - children
+        if stack:
+            stack[-1] += elapsed
+
+
+def install_import_timer():
+    """이후의 import 를 최상위 패키지별로 측정 (프로세스에서 한 번만 설치)"""
+    global _installed
+    if not _installed:
+        builtins.__import__ = _timed_import
+        _installed = True
+
+
+def import_report(top=15):
+    """[(패키지, 초), ...] 오래 걸린 순"""
+    return sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def format_import_report(top=15):
+    lines = [f"[startup] import 시간 (프로세스 시작 후 {time.time() - PROCESS_STARTED:.1f}s)"]
+    for name, seconds in import_report(top):
+        lines.append(f"  {name:<32} {seconds * 1000:8.1f} ms")
+    lines.append(f"  {'합계':<32} {sum(IMPORT_TIMES.values()) * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+def print_import_report_once(top=15):
+    """첫 화면을 그린 뒤 프로세스에서 한 번만 콘솔에 import 시간 보고"""
+    global _reported
+    if not _reported:
+        _reported = True
+        print(format_import_report(top), flush=True)
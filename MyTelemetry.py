@@ -0,0 +1,281 @@
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from MyCache import CACHE_DIR
+
+# Prometheus 텍스트 파일 경로와 최소 기록 간격(초)
+METRICS_PATH = os.getenv("METRICS_PATH", os.path.join(CACHE_DIR, "metrics.prom"))
+METRICS_WRITE_INTERVAL = 10
+
+# 예상 비용 계산용 단가 (USD). 토큰 단가는 1K 토큰당,
+# whisper 는 오디오 1분당, tts 는 1K 글자당. 표에 없는 모델(로컬 임베딩 등)은 0으로 계산
+PRICES = {
+    "gpt-4o": {"input": 0.0025, "output": 0.01},
+    "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
+    "text-embedding-ada-002": {"input": 0.0001},
+    "gemini-1.5-flash": {"input": 0.000075, "output": 0.0003},
+    "gemini-2.0-flash": {"input": 0.0001, "output": 0.0004},
+    "whisper-1": {"minute": 0.006},
+    "tts-1": {"kchar": 0.015},
+}
+
+_page = contextvars.ContextVar("telemetry_page", default="unknown")
+_session = contextvars.ContextVar("telemetry_session", default="-")
+
+_lock = threading.Lock()
+# (page, kind, model) -> 집계
+_totals = defaultdict(lambda: {
+    "calls": 0, "errors": 0, "cached": 0, "latency": 0.0,
+    "input_tokens": 0, "output_tokens": 0, "units": 0.0, "cost": 0.0,
+})
+# (session, page) -> 집계
+_sessions = defaultdict(lambda: {"calls": 0, "tokens": 0, "cost": 0.0, "last": 0.0})
+# 최근 호출 기록
+RECENT_CALLS = deque(maxlen=200)
+# page -> 스트리밍 응답의 첫 토큰까지 걸린 시간 (합계/횟수는 Prometheus 용, 최근 값은 분위수 계산용)
+_ttft = defaultdict(lambda: {"count": 0, "sum": 0.0, "recent": deque(maxlen=200)})
+_last_write = 0.0
+
+
+def set_page(page):
+    """현재 페이지(와 Streamlit 세션)를 기록 대상으로 지정. 각 페이지 스크립트 시작 시 호출"""
+    _page.set(page)
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            _session.set(ctx.session_id)
+    except Exception:
+        pass
+
+
+def get_page():
+    return _page.get()
+
+
+def estimate_cost(model, input_tokens=0, output_tokens=0, units=0.0):
+    price = PRICES.get(model)
+    if price is None:
+        return 0.0
+    return (
+        input_tokens / 1000 * price.get("input", 0.0)
+        + output_tokens / 1000 * price.get("output", 0.0)
+        + units / 60 * price.get("minute", 0.0)
+        + units / 1000 * price.get("kchar", 0.0)
+    )
+
+
+def record(kind, model, latency, input_tokens=0, output_tokens=0, units=0.0, error=False, cached=False):
+    """
+    외부 모델 호출 하나를 기록.
+    kind: llm / embedding / whisper / tts / vision, units: whisper 는 초, tts 는 글자 수
+    """
+    page, session = _page.get(), _session.get()
+    cost = 0.0 if cached else estimate_cost(model, input_tokens, output_tokens, units)
+    with _lock:
+        total = _totals[(page, kind, model)]
+        total["calls"] += 1
+        total["errors"] += int(error)
+        total["cached"] += int(cached)
+        total["latency"] += latency
+        total["input_tokens"] += input_tokens
+        total["output_tokens"] += output_tokens
+        total["units"] += units
+        total["cost"] += cost
+        per_session = _sessions[(session, page)]
+        per_session["calls"] += 1
+        per_session["tokens"] += input_tokens + output_tokens
+        per_session["cost"] += cost
+        per_session["last"] = time.time()
+        RECENT_CALLS.append({
+            "time": time.time(), "page": page, "session": session, "kind": kind, "model": model,
+            "latency": latency, "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "cost": cost, "error": error, "cached": cached,
+        })
+    _maybe_write()
+
+
+def record_ttft(seconds, page=None):
+    """스트리밍 응답의 첫 토큰까지 걸린 시간(초)을 페이지별로 기록"""
+    page = page or _page.get()
+    with _lock:
+        ttft = _ttft[page]
+        ttft["count"] += 1
+        ttft["sum"] += seconds
+        ttft["recent"].append(seconds)
+    _maybe_write()
+
+
+class TimedCall:
+    """
+    with 블록의 실행 시간을 재서 기록. 블록 안에서 토큰 수 등을 채운다.
+
+        with TimedCall("tts", "tts-1") as call:
+            ...
+            call.units = len(text)
+    """
+
+    def __init__(self, kind, model):
+        self.kind = kind
+        self.model = model
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.units = 0.0
+        self.cached = False
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.kind, self.model, time.perf_counter() - self.started, self.input_tokens,
+               self.output_tokens, self.units, error=exc_type is not None, cached=self.cached)
+        return False
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain 모델 호출의 지연 시간/토큰 수를 기록하는 콜백 (모델 객체에 붙여 공유해도 안전).
+    스트리밍 응답처럼 사용량이 오지 않으면 tiktoken 으로 추정하고,
+    사용량도 토큰도 없으면 LLM 캐시 응답으로 보고 비용 0으로 기록한다.
+    """
+
+    def __init__(self, model, kind="llm"):
+        self.model = model
+        self.kind = kind
+        self._runs = {}
+        self._runs_lock = threading.Lock()
+
+    def _start(self, run_id, prompt_text):
+        with self._runs_lock:
+            self._runs[run_id] = {"started": time.perf_counter(), "prompt": prompt_text, "tokens": 0}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "\n".join(prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "\n".join(str(m.content) for batch in messages for m in batch))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None:
+            run["tokens"] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._runs_lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        latency = time.perf_counter() - run["started"]
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            record(self.kind, self.model, latency, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        elif run["tokens"]:
+            from MyLCH import count_tokens
+
+            output = "".join(g.text for gens in response.generations for g in gens)
+            record(self.kind, self.model, latency, count_tokens(run["prompt"]), count_tokens(output))
+        else:
+            record(self.kind, self.model, latency, cached=True)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._runs_lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            record(self.kind, self.model, time.perf_counter() - run["started"], error=True)
+
+
+def snapshot():
+    """관리자 페이지용: (페이지/종류/모델별 집계, 세션별 집계) 리스트"""
+    with _lock:
+        totals = [dict(page=p, kind=k, model=m, **v) for (p, k, m), v in _totals.items()]
+        sessions = [dict(session=s, page=p, **v) for (s, p), v in _sessions.items()]
+    return totals, sessions
+
+
+def recent_calls():
+    """관리자 페이지용: 최근 호출 기록 복사본 (최신 것부터)"""
+    with _lock:
+        return list(reversed(RECENT_CALLS))
+
+
+def ttft_summary():
+    """관리자 페이지용: 페이지별 첫 토큰까지 시간 (횟수, 평균, 최근 200회의 p50/p95)"""
+    with _lock:
+        items = [(page, t["count"], t["sum"], sorted(t["recent"])) for page, t in _ttft.items()]
+    return [
+        {"page": page, "count": count, "avg": round(total / count, 3),
+         "p50": round(recent[len(recent) // 2], 3),
+         "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 3)}
+        for page, count, total, recent in items
+    ]
+
+
+def session_usage(page=None):
+    """현재 세션(과 페이지)의 누적 호출 수/토큰/예상 비용"""
+    session = _session.get()
+    page = page or _page.get()
+    with _lock:
+        usage = _sessions.get((session, page))
+        return dict(usage) if usage else {"calls": 0, "tokens": 0, "cost": 0.0, "last": 0.0}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def export_prometheus():
+    """Prometheus 텍스트 형식으로 집계값을 반환 (세션은 라벨 수가 많아 제외)"""
+    metrics = [
+        ("app_model_calls_total", "counter", "Model calls", "calls"),
+        ("app_model_errors_total", "counter", "Failed model calls", "errors"),
+        ("app_model_cached_total", "counter", "Calls answered from the response cache", "cached"),
+        ("app_model_latency_seconds_sum", "counter", "Total call latency in seconds", "latency"),
+        ("app_model_input_tokens_total", "counter", "Input tokens", "input_tokens"),
+        ("app_model_output_tokens_total", "counter", "Output tokens", "output_tokens"),
+        ("app_model_units_total", "counter", "Audio seconds (whisper) or characters (tts)", "units"),
+        ("app_model_cost_usd_total", "counter", "Estimated cost in USD", "cost"),
+    ]
+    totals, _ = snapshot()
+    lines = []
+    for name, kind, help_text, field in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for t in totals:
+            labels = f'page="{_label(t["page"])}",kind="{_label(t["kind"])}",model="{_label(t["model"])}"'
+            lines.append(f"{name}{{{labels}}} {t[field]}")
+    with _lock:
+        ttft = [(page, t["sum"], t["count"]) for page, t in _ttft.items()]
+    lines.append("# HELP app_ttft_seconds Time to first streamed token in seconds")
+    lines.append("# TYPE app_ttft_seconds summary")
+    for page, total, count in ttft:
+        lines.append(f'app_ttft_seconds_sum{{page="{_label(page)}"}} {total}')
+        lines.append(f'app_ttft_seconds_count{{page="{_label(page)}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=METRICS_PATH):
+    """node_exporter textfile collector 등이 읽을 수 있도록 파일을 원자적으로 교체"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(export_prometheus())
+    os.replace(tmp, path)
+
+
+def _maybe_write():
+    global _last_write
+    now = time.time()
+    if now - _last_write < METRICS_WRITE_INTERVAL:
+        return
+    _last_write = now
+    try:
+        write_prometheus()
+    except OSError:
+        pass
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import time
+
+from MyCache import DiskCache, hash_key
+from MyRegistry import get_shared
+
+USER_AGENT = "Mozilla/5.0 (compatible; StreamlitApp/1.0)"
+# 이 시간(초) 안에 가져온 페이지는 서버에 다시 묻지 않고 캐시를 그대로 사용
+FRESH_SECONDS = 3600
+FETCH_TIMEOUT = 10
+MAX_CONNECTIONS = 20
+
+_web_cache = None
+
+
+def getWebCache():
+    # 추출한 본문과 ETag/Last-Modified 를 URL 별로 저장 (7일 TTL)
+    global _web_cache
+    if _web_cache is None:
+        _web_cache = DiskCache("web_pages", max_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600)
+    return _web_cache
+
+
+def extract_text(html):
+    """HTML 에서 본문 텍스트 추출 (<article> 이 있으면 그 안만). lxml 이 없으면 BeautifulSoup 사용"""
+    try:
+        import lxml.html
+
+        doc = lxml.html.fromstring(html)
+        for node in doc.xpath("//script|//style|//noscript|//comment()"):
+            node.drop_tree()
+        articles = doc.xpath("//article")
+        pieces = (articles[0] if articles else doc).itertext()
+    except ImportError:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        for node in soup(["script", "style", "noscript"]):
+            node.decompose()
+        article = soup.find("article")
+        pieces = (article or soup).get_text(separator="\n").splitlines()
+    lines = [line.strip() for piece in pieces for line in piece.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+class _WebLoop:
+    """
+    백그라운드 스레드의 이벤트 루프와 그 위의 httpx.AsyncClient 하나를 프로세스 전체에서 공유.
+    요청마다 새 연결을 만들지 않고 keep-alive 연결 풀을 재사용한다.
+    """
+
+    def __init__(self):
+        import httpx
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+        async def make_client():
+            return httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                timeout=FETCH_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, keepalive_expiry=60),
+            )
+
+        self.client = self.run(make_client())
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+async def _fetch(client, url, cache):
+    key = hash_key("web", url)
+    raw = cache.get(key)
+    entry = json.loads(raw) if raw else None
+    if entry and time.time() - entry["fetched"] < FRESH_SECONDS:
+        return dict(entry, cached=True)
+
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    resp = await client.get(url, headers=headers)
+    if resp.status_code == 304 and entry:
+        # 바뀌지 않았음: 본문을 다시 받거나 파싱하지 않음
+        entry["fetched"] = time.time()
+        cache.set(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        return dict(entry, cached=True)
+    resp.raise_for_status()
+    entry = {
+        "url": url,
+        "text": extract_text(resp.text),
+        "etag": resp.headers.get("etag"),
+        "last_modified": resp.headers.get("last-modified"),
+        "fetched": time.time(),
+    }
+    cache.set(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+    return dict(entry, cached=False)
+
+
+async def _fetch_all(client, urls, cache):
+    async def safe(url):
+        try:
+            return await _fetch(client, url, cache)
+        except Exception as e:
+            return {"url": url, "text": None, "error": str(e)}
+
+    return await asyncio.gather(*(safe(url) for url in urls))
+
+
+def fetch_many(urls):
+    """
+    여러 URL 을 동시에 가져와 본문 텍스트를 추출. 입력 순서대로
+    [{"url", "text", "cached"} 또는 {"url", "text": None, "error"}] 를 반환한다.
+    """
+    urls = list(dict.fromkeys(u.strip() for u in urls if u and u.strip()))
+    if not urls:
+        return []
+    web = get_shared("web_loop", _WebLoop)
+    return web.run(_fetch_all(web.client, urls, getWebCache()))
@@ -0,0 +1,75 @@
+import datetime
+
+import streamlit as st
+
+from MyStartup import import_report
+from MyTelemetry import METRICS_PATH, export_prometheus, recent_calls, snapshot, ttft_summary, write_prometheus
+
+st.title("🛠️ 사용량 / 지연 시간")
+st.sidebar.markdown("모델 호출 기록 (관리자 전용)")
+
+totals, sessions = snapshot()
+
+# 페이지별 합계
+by_page = {}
+for t in totals:
+    page = by_page.setdefault(t["page"], {"page": t["page"], "calls": 0, "errors": 0, "tokens": 0, "cost": 0.0, "latency": 0.0})
+    page["calls"] += t["calls"]
+    page["errors"] += t["errors"]
+    page["tokens"] += t["input_tokens"] + t["output_tokens"]
+    page["cost"] += t["cost"]
+    page["latency"] += t["latency"]
+
+c1, c2, c3 = st.columns(3)
+c1.metric("총 호출 수", sum(p["calls"] for p in by_page.values()))
+c2.metric("총 토큰", f"{sum(p['tokens'] for p in by_page.values()):,}")
+c3.metric("예상 비용 (USD)", f"${sum(p['cost'] for p in by_page.values()):.4f}")
+
+st.subheader("페이지별")
+st.dataframe(
+    [dict(p, avg_latency=round(p["latency"] / p["calls"], 3) if p["calls"] else 0.0)
+     for p in sorted(by_page.values(), key=lambda p: p["cost"], reverse=True)],
+    use_container_width=True,
+)
+
+st.subheader("페이지 / 종류 / 모델별")
+st.dataframe(
+    [dict(t, avg_latency=round(t["latency"] / t["calls"], 3) if t["calls"] else 0.0)
+     for t in sorted(totals, key=lambda t: t["cost"], reverse=True)],
+    use_container_width=True,
+)
+
+st.subheader("세션별")
+st.dataframe(
+    [dict(s, last=datetime.datetime.fromtimestamp(s["last"]).strftime("%H:%M:%S"))
+     for s in sorted(sessions, key=lambda s: s["cost"], reverse=True)],
+    use_container_width=True,
+)
+
+st.subheader("첫 토큰까지 시간 (초)")
+ttft = ttft_summary()
+if ttft:
+    st.dataframe(sorted(ttft, key=lambda t: t["p95"], reverse=True), use_container_width=True)
+else:
+    st.caption("아직 기록된 스트리밍 응답이 없습니다.")
+
+with st.expander("최근 호출 (최대 200건)"):
+    st.dataframe(
+        [dict(c, time=datetime.datetime.fromtimestamp(c["time"]).strftime("%H:%M:%S")) for c in recent_calls()],
+        use_container_width=True,
+    )
+
+with st.expander("모듈 import 시간"):
+    st.dataframe([{"package": name, "ms": round(seconds * 1000, 1)} for name, seconds in import_report(30)],
+                 use_container_width=True)
+
+st.subheader("Prometheus")
+metrics_text = export_prometheus()
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button("metrics.prom 다운로드", metrics_text, file_name="metrics.prom", mime="text/plain")
+with col2:
+    if st.button("지금 파일로 기록"):
+        write_prometheus()
+        st.success(f"{METRICS_PATH} 에 기록했습니다.")
+st.code(metrics_text, language="text")
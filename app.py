@@ -1,4 +1,15 @@
+import os
+
 import streamlit as st
+from dotenv import load_dotenv
+
+from MyStartup import install_import_timer, print_import_report_once
+
+# ADMIN_TOKEN 등 .env 설정을 다른 페이지 모듈이 로드되기 전에도 읽을 수 있도록
+load_dotenv()
+
+# 페이지가 필요한 라이브러리만 처음 사용할 때 로드하므로, 어떤 import가 얼마나 걸렸는지 기록
+install_import_timer()
 
 
 main_page = st.Page("main.py", title="학습 어시스트", icon="📚")
@@ -13,6 +24,17 @@ page_8 = st.Page("p8.py", title="달력에 메모하기", icon="📆️")
 
 
 
-page = st.navigation([main_page,page_1, page_2, page_3, page_4, page_5, page_6, page_7, page_8])
+pages = [main_page,page_1, page_2, page_3, page_4, page_5, page_6, page_7, page_8]
+
+# 관리자 페이지(사용량/비용)는 ?admin=<ADMIN_TOKEN> 으로 접속한 세션에만 메뉴에 추가
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+    st.session_state["is_admin"] = True
+if st.session_state.get("is_admin"):
+    pages.append(st.Page("admin.py", title="사용량", icon="🛠️", url_path="admin"))
+
+page = st.navigation(pages)
+
+page.run()
 
-page.run()
\ No newline at end of file
+print_import_report_once()
@@ -0,0 +1,274 @@
+"""
+오프라인 파이프라인 벤치마크.
+
+각 페이지의 핵심 단계(PDF 추출, 청크 분할, 임베딩, FAISS 생성, 유사도/하이브리드 검색,
+프롬프트 조립, p1/p7 JSON 파싱, p3 문장 분리)를 고정 입력(data/AI.txt, data/booksv_02.csv,
+생성한 PDF)과 결정적인 가짜 LLM/임베딩으로 실행하고, 단계별 지연 시간과 최대 메모리를 보고한다.
+네트워크 호출은 없다 (tiktoken 인코딩 파일은 미리 캐시되어 있어야 함).
+
+    python bench.py                    # 실행 후 bench_baseline.json 과 비교
+    python bench.py --repeat 10        # 단계별 반복 횟수 (중앙값 사용)
+    python bench.py --save-baseline    # 현재 결과를 기준값으로 저장
+    python bench.py --check            # 기준보다 느려지거나 메모리가 늘어난 단계가 있으면 종료 코드 1
+
+메모리(peak_kb)는 tracemalloc 으로 잰 이 프로세스의 파이썬 할당량이다. 프로세스 풀을 쓰는
+단계(pdf_extract_large)는 워커 메모리가 여기에 보이지 않으므로 워커의 최대 RSS(worker_rss_kb)를 따로 기록한다.
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 캐시/임베딩이 실제 환경과 섞이지 않도록 모듈 import 전에 설정
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_cache_")
+os.environ["EMBEDDING_PROVIDER"] = "local"
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(ROOT, "data")
+BASELINE_PATH = os.path.join(ROOT, "bench_baseline.json")
+
+# 기준값보다 이 배율 이상 느리거나 메모리를 더 쓰면 회귀로 표시
+REGRESSION_RATIO = 1.25
+# 비교할 측정값: (결과 키, 표시 이름, 무시할 차이). 아주 짧은 단계의 측정 잡음은 회귀로 보지 않음
+METRICS = [("ms", "ms", 1.0), ("peak_kb", "peak KB", 64.0), ("worker_rss_kb", "worker RSS KB", 4096.0)]
+# PDF 한 페이지에 넣을 줄 수와 한 줄의 글자 수
+PDF_LINES_PER_PAGE = 55
+PDF_LINE_CHARS = 95
+# 큰 PDF 추출 단계의 프로세스 수
+PDF_WORKERS = 4
+
+QUERIES = [
+    "What is artificial intelligence?",
+    "machine learning applications in industry",
+    "detective novel by Agatha Christie",
+    "a story about family and faith",
+    "history of science fiction",
+    "neural networks and deep learning",
+    "books for children about animals",
+    "war and politics in the twentieth century",
+]
+
+
+# ---------------- 고정 입력 ----------------
+
+def load_corpus():
+    """AI.txt 본문 + 도서 CSV의 description 열"""
+    with open(os.path.join(DATA_DIR, "AI.txt"), encoding="utf-8") as f:
+        parts = [f.read()]
+    with open(os.path.join(DATA_DIR, "booksv_02.csv"), encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("description"):
+                parts.append(f"{row['title']}. {row['description']}")
+    return "\n\n".join(parts)
+
+
+def _wrap(text, width):
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(text, pages):
+    """외부 라이브러리 없이 텍스트를 여러 페이지의 PDF(Helvetica, latin-1)로 만든다"""
+    lines = _wrap(text, PDF_LINE_CHARS)
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for i in range(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        start = (i * PDF_LINES_PER_PAGE) % max(len(lines), 1)
+        page_lines = (lines[start:] + lines)[:PDF_LINES_PER_PAGE]
+        stream = "BT /F1 10 Tf 13 TL 40 770 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in page_lines) + " ET"
+        data = stream.encode("latin-1", "replace")
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for i in sorted(objects):
+        offsets[i] = len(out)
+        out += b"%d 0 obj\n" % i + objects[i] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for i in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[i]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+# ---------------- 가짜 LLM 응답 ----------------
+
+def fake_mcq_stream(n=10, choices_count=4, chunk_chars=7):
+    """p1 구조화 출력(JSON)을 스트리밍처럼 작은 조각으로 나누어 반환"""
+    questions = [
+        {
+            "question": f"문항 {i + 1}: 인공지능의 정의로 가장 알맞은 것은?",
+            "choices": [f"보기 {j + 1} — 설명 \"{i}-{j}\"" for j in range(choices_count)],
+            "answer": i % choices_count,
+            "explanation": "본문 첫 문단에서 인공지능을 기계나 소프트웨어의 지능으로 정의한다.",
+        }
+        for i in range(n)
+    ]
+    text = json.dumps({"questions": questions}, ensure_ascii=False)
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+
+def fake_plan_response(sessions=30):
+    """p7 스터디 플랜 응답: 설명 문장 사이에 JSON 이 섞인 형태"""
+    plan = {
+        "sessions": [
+            {"date": f"2024-03-{i % 28 + 1:02d}", "topic": f"챕터 {i + 1}", "tasks": ["읽기", "요약", "문제 풀이"], "minutes": 60}
+            for i in range(sessions)
+        ]
+    }
+    return "아래는 요청하신 학습 계획입니다.\n```json\n" + json.dumps(plan, ensure_ascii=False) + "\n```\n도움이 되길 바랍니다."
+
+
+# ---------------- 실행 ----------------
+
+def measure(fn, repeat):
+    """(중앙값 ms, 최대 메모리 KB, 마지막 결과). 메모리는 별도 1회 실행에서 tracemalloc 으로 측정"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), peak / 1024, result
+
+
+def children_max_rss_kb():
+    """지금까지 종료된 자식 프로세스 중 가장 큰 최대 RSS (KB). 측정할 수 없는 환경이면 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux 는 KB, macOS 는 바이트 단위
+    return rss / 1024 if sys.platform == "darwin" else rss
+
+
+def run(repeat):
+    from langchain_community.vectorstores import FAISS
+
+    from MyLCH import HashingEmbeddings, get_text_chunks, pack_documents
+    from MyLLM import extract_json_from_text, iter_json_array_items, split_into_sentences
+    from MyPDF import iter_pdf_pages
+    from MyQBank import build_mcq_query, validate_mcq
+    from MyRetriever import HybridRetriever
+
+    corpus = load_corpus()
+    small_pdf = make_pdf(corpus, pages=12)
+    large_pdf = make_pdf(corpus, pages=120)
+    embeddings = HashingEmbeddings()
+    results = {}
+
+    def stage(name, fn, reps=repeat, workers=False):
+        ms, kb, value = measure(fn, reps)
+        results[name] = {"ms": round(ms, 2), "peak_kb": round(kb, 1)}
+        line = f"  {name:<20} {ms:10.2f} ms  {kb:10.1f} KB"
+        rss = children_max_rss_kb() if workers else None
+        if rss is not None:
+            results[name]["worker_rss_kb"] = round(rss, 1)
+            line += f"  (워커 최대 RSS {rss:,.0f} KB)"
+        print(line, flush=True)
+        return value
+
+    print(f"corpus: {len(corpus):,} chars, repeat={repeat}")
+    stage("pdf_extract_small", lambda: list(iter_pdf_pages(small_pdf)))
+    # 프로세스 풀 경로는 비용이 커서 반복 횟수를 줄임. peak_kb 는 부모 프로세스만, 워커는 worker_rss_kb
+    # 워커 수를 고정해 CPU 수와 관계없이 항상 프로세스 풀 경로를 측정
+    stage("pdf_extract_large", lambda: list(iter_pdf_pages(large_pdf, max_workers=PDF_WORKERS)),
+          reps=max(1, repeat // 3), workers=True)
+    chunks = stage("chunk", lambda: get_text_chunks(corpus))
+    vectors = stage("embed", lambda: embeddings.embed_documents(chunks))
+    vectorstore = stage("faiss_build", lambda: FAISS.from_embeddings(list(zip(chunks, vectors)), embeddings))
+    stage("similarity_search", lambda: [vectorstore.similarity_search(q, k=12) for q in QUERIES])
+    retriever = stage("bm25_build", lambda: HybridRetriever.from_vectorstore(vectorstore, k=12, reranker=None))
+    docs = stage("hybrid_search", lambda: [retriever.invoke(q) for q in QUERIES])[0]
+    stage("prompt_assembly", lambda: (
+        "\n\n".join(d.page_content for d in pack_documents(docs)) + "\n\n" + build_mcq_query(10, "medium")
+    ))
+    mcq_chunks = fake_mcq_stream()
+    stage("p1_json_parse", lambda: [q for q in iter_json_array_items(mcq_chunks) if validate_mcq(q) is None])
+    plan_text = fake_plan_response()
+    stage("p7_json_parse", lambda: extract_json_from_text(plan_text))
+    stage("p3_sentences", lambda: split_into_sentences(corpus))
+    return results
+
+
+def compare(results, baseline):
+    regressions = []
+    print(f"\n{'stage':<20} {'metric':<14} {'baseline':>12} {'now':>12} {'ratio':>7}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<20} {'ms':<14} {'-':>12} {now['ms']:12.2f} {'new':>7}")
+            continue
+        for key, label, noise in METRICS:
+            if key not in now or key not in base:
+                continue
+            ratio = now[key] / base[key] if base[key] else float("inf")
+            regressed = ratio >= REGRESSION_RATIO and now[key] - base[key] > noise
+            flag = ("  <-- 느려짐" if key == "ms" else "  <-- 메모리 증가") if regressed else ""
+            print(f"{name:<20} {label:<14} {base[key]:12.2f} {now[key]:12.2f} {ratio:7.2f}{flag}")
+            if flag:
+                regressions.append(f"{name}.{key}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="오프라인 파이프라인 벤치마크")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="회귀가 있으면 종료 코드 1")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n기준값 저장: {BASELINE_PATH}")
+        return 0
+    if not os.path.exists(BASELINE_PATH):
+        print("\n기준값이 없습니다. --save-baseline 으로 먼저 저장하세요.")
+        return 0
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        regressions = compare(results, json.load(f))
+    if regressions and args.check:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
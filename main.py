@@ -1,9 +1,5 @@
 import streamlit as st
 
-from MyLCH import getOpenAI, makeAudio, progressBar, getGenAI
-
-import streamlit as st
-
 # 페이지 설정
 st.set_page_config(
     page_title="공부 어플",
@@ -1,10 +1,13 @@
 import streamlit as st
-from PyPDF2 import PdfReader
 from langchain.chains.question_answering import load_qa_chain
-from langchain_community.callbacks import get_openai_callback
-from MyLCH import process_text, getOpenAI
+from MyLCH import load_document_index, getOpenAI, embedding_cache_stats, pack_documents
+from MyLLM import run_parallel
+from MyQBank import collect_mcq, ensure_filled, getQuestionBank
+from MyProgress import StageProgress, ProgressCallbackHandler
+from MyTelemetry import session_usage, set_page
 
-import json, re, ast
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p1")
 
 st.set_page_config(layout="wide")
 st.markdown("# 개념 학습하기")
@@ -54,94 +57,90 @@ if pdf is None:
 # ------------------------
 # PDF에서 텍스트 및 전처리
 # ------------------------
-pdf_reader = PdfReader(pdf)
-text = ""
-for page in pdf_reader.pages:
-    page_text = page.extract_text()
-    if page_text:
-        text += page_text
-
-# 사용자 정의 전처리 함수
-documents = process_text(text)
+# 같은 PDF는 저장된 인덱스를 재사용 (처음 보는 파일만 추출/임베딩)
+document_stages = [
+    ("extract", "PDF 텍스트 추출 중...", 3),
+    ("chunk", "텍스트 분할 중...", 1),
+    ("embed", "임베딩 및 인덱스 생성 중...", 4),
+]
+# 업로드가 바뀔 때만 문서 파이프라인을 실행하고, 그 외의 rerun 에서는 세션에 둔 인덱스를 그대로 사용
+upload_key = getattr(pdf, "file_id", None) or (pdf.name, pdf.size)
+if st.session_state.get('doc_index_key') != upload_key:
+    with StageProgress(document_stages) as progress:
+        st.session_state['doc_index'] = load_document_index([pdf], progress=progress)
+    st.session_state['doc_index_key'] = upload_key
+doc_digest, documents = st.session_state['doc_index']
+cache_stats = embedding_cache_stats()
+st.sidebar.caption(f"임베딩 캐시 — hit {cache_stats['hits']} / miss {cache_stats['misses']}")
+# 업로드 직후부터 현재 난이도의 문제를 백그라운드에서 미리 만들어 둠
+ensure_filled(doc_digest, st.session_state['mcq_difficulty'], documents)
+st.sidebar.caption(f"문제 은행 — {st.session_state['mcq_difficulty']} {getQuestionBank().available(doc_digest, st.session_state['mcq_difficulty'])}문항 준비됨")
+usage = session_usage()
+st.sidebar.caption(f"이 세션 사용량 — 호출 {usage['calls']}회 · 토큰 {usage['tokens']:,} · 예상 ${usage['cost']:.4f}")
 
 # ------------------------
 # 유틸: 문제 생성 함수 (JSON 파싱 포함)
 # ------------------------
+def build_summary_query(m):
+    return f"업로드된 PDF 파일의 핵심 내용을 {m}문장으로 간결하게 요약해주세요."
+
+def ask_documents(question, search_query, callbacks=None):
+    """
+    문서에서 관련 청크를 찾아 stuff 체인으로 질의하고 응답 텍스트를 반환.
+    callbacks 없이 호출하면 화면 출력이 없으므로 다른 스레드에서 동시에 실행해도 된다.
+    """
+    # 관련도 순으로 넉넉히 찾은 뒤 토큰 예산 안에서만 컨텍스트에 넣음
+    docs = pack_documents(documents.similarity_search(search_query, k=12))
+    llm = getOpenAI()
+    chain = load_qa_chain(llm, chain_type='stuff')
+    # 토큰/비용은 모델에 붙은 telemetry 콜백이 페이지·세션별로 기록
+    return chain.run(input_documents=docs, question=question, callbacks=callbacks)
+
+def take_from_bank(n, difficulty):
+    """문제 은행에서 문항을 꺼내고, 꺼낸 만큼 백그라운드에서 다시 채움"""
+    questions = getQuestionBank().take(doc_digest, difficulty, n)
+    ensure_filled(doc_digest, difficulty, documents)
+    return questions
+
+def serve_mcq(n, difficulty, choices_count=4, on_item=None):
+    """
+    1) 미리 만들어 둔 문제 은행에서 꺼내고 (보통 여기서 바로 끝남)
+    2) 모자란 만큼만 바로 생성해서 채움. on_item 없이 호출하면 화면 출력이 없다.
+    """
+    questions = take_from_bank(n, difficulty)
+    if len(questions) < n:
+        live = collect_mcq(documents, n - len(questions), difficulty, choices_count, on_item=on_item,
+                           avoid=[q['question'] for q in questions])
+        getQuestionBank().add(doc_digest, difficulty, live, served=True)
+        questions += live
+    return questions
+
 def generate_mcq_from_llm(n, difficulty, choices_count=4):
     """
-    LLM에 질의하여 문제를 생성하고, 파싱된 문제 리스트를 반환.
+    문제 은행에서 문항을 꺼내고, 모자라면 LLM에 질의하여 완성되는 문항부터 바로 미리 보여준 뒤 문제 리스트를 반환.
     실패 시 None 반환.
     """
-    query = (
-        f"업로드된 PDF 내용을 바탕으로 **객관식(선다형) {n}문항**을 만들어주세요. "
-        f"난이도는 '{difficulty}'로 해주세요. (easy/medium/hard의 의미에 맞게 출제)\n"
-        "응답은 반드시 **JSON 배열** 형식으로만 출력하세요. 배열의 각 원소는 다음 필드를 가져야 합니다:\n\n"
-        " - question: (문항 text, 한국어)\n"
-        f" - choices: (선택지 리스트, 길이 {choices_count}, 한국어)\n"
-        " - answer: (정답 인덱스: 0부터 시작하는 정수)\n"
-        " - explanation: (정답 해설/설명, 한국어)\n\n"
-        "예시 출력 형식:\n"
-        '[{"question":"...","choices":["A","B","C","D"],"answer":1,"explanation":"..."}, ...]\n\n'
-        "위 규격을 정확히 지켜서 유효한 JSON만 출력해주세요."
-    )
+    preview = st.empty()
+    shown = []
+
+    def show_preview(q):
+        shown.append(q)
+        with preview.container():
+            for i, item in enumerate(shown):
+                st.markdown(f"**문제 {i+1}.** {item['question']}")
+                st.caption(" / ".join(f"{chr(65 + j)}. {c}" for j, c in enumerate(item['choices'])))
 
     try:
-        docs = documents.similarity_search("핵심 개념 요약")
-        llm = getOpenAI()
-        chain = load_qa_chain(llm, chain_type='stuff')
-        with get_openai_callback() as cb:
-            raw = chain.run(input_documents=docs, question=query)
+        questions = serve_mcq(n, difficulty, choices_count, on_item=show_preview)
     except Exception as e:
         st.error(f"LLM 호출 중 오류가 발생했습니다: {e}")
         return None
-
-    # JSON 추출 시도
-    json_text = None
-    m1 = re.search(r'(\[.*\])', raw, re.DOTALL)
-    if m1:
-        json_text = m1.group(1)
-    else:
-        m2 = re.search(r'(\{.*\})', raw, re.DOTALL)
-        if m2:
-            json_text = "[" + m2.group(1) + "]"
-
-    questions = None
-    if json_text:
-        try:
-            questions = json.loads(json_text)
-        except Exception:
-            try:
-                questions = ast.literal_eval(json_text)
-            except Exception:
-                questions = None
-
-    if questions is None:
-        st.warning("LLM이 출력한 JSON을 자동 파싱하지 못했습니다. 원본 응답을 아래에서 확인하세요.")
-        st.subheader("원본 응답 (LLM)")
-        st.write(raw)
-        st.error("자동 파싱 실패: 올바른 JSON 형식으로 재생성하거나 포맷을 확인하세요.")
-        return None
-
-    # 유효성 검사 및 n에 맞춰 자르기/경고
-    if not isinstance(questions, list):
-        st.error("LLM 출력이 리스트(배열)가 아닙니다.")
+    preview.empty()
+    if not questions:
+        st.error("유효한 문항을 생성하지 못했습니다. 다시 시도해주세요.")
         return None
-
-    if len(questions) > n:
-        st.warning(f"LLM이 {len(questions)}문항을 생성했습니다. 요청한 {n}문항만 사용합니다.")
-        questions = questions[:n]
     if len(questions) < n:
         st.warning(f"LLM이 {len(questions)}문항만 생성했습니다. 요청한 {n}문항보다 적습니다. 생성된 만큼만 표시합니다.")
-
-    # 각 문항 검사
-    for idx, q in enumerate(questions):
-        if not all(k in q for k in ("question","choices","answer","explanation")):
-            st.error(f"{idx+1}번 문항에 필수 필드가 없습니다.")
-            return None
-        if not isinstance(q['choices'], list) or len(q['choices']) != choices_count:
-            st.error(f"{idx+1}번 문항의 선택지가 {choices_count}개가 아닙니다.")
-            return None
-
     return questions
 
 # ------------------------
@@ -166,6 +165,9 @@ with st.form("settings_form", clear_on_submit=False):
         # 이 버튼을 누르면 즉시 문제를 생성하도록 동작함
         create_mcq = st.form_submit_button("문제 생성")
 
+    # 요약과 문제를 동시에 생성
+    generate_all = st.form_submit_button("요약 + 문제 모두 생성")
+
     # 폼 제출 시 세션에 설정 저장
     st.session_state['summary_sentences'] = m
     st.session_state['mcq_requested_n'] = n
@@ -179,19 +181,51 @@ if 'summary_text' not in st.session_state:
 
 if summary_submit:
     m = st.session_state['summary_sentences']
-    summary_query = f"업로드된 PDF 파일의 핵심 내용을 {m}문장으로 간결하게 요약해주세요."
-    with st.spinner("요약 생성 중..."):
+    summary_query = build_summary_query(m)
+    summary_stages = [
+        ("retrieve", "관련 내용 찾는 중...", 1),
+        ("request", "요약 요청 중...", 1),
+        ("tokens", "요약 생성 중...", 4),
+    ]
+    with StageProgress(summary_stages) as progress:
         try:
-            docs = documents.similarity_search(summary_query)
-            llm = getOpenAI()
-            chain = load_qa_chain(llm, chain_type='stuff')
-            with get_openai_callback() as cb:
-                response = chain.run(input_documents=docs, question=summary_query)
+            progress.stage("retrieve")
+            response = ask_documents(summary_query, summary_query, callbacks=[ProgressCallbackHandler(progress)])
             st.session_state['summary_text'] = response
             st.success("요약이 생성되었습니다.")
         except Exception as e:
             st.error(f"요약 생성 중 오류 발생: {e}")
 
+# ------------------------
+# 모두 생성: 요약과 문제를 동시에 요청하고, 끝나는 대로 표시
+# ------------------------
+if generate_all:
+    summary_query = build_summary_query(st.session_state['summary_sentences'])
+    n = st.session_state['mcq_requested_n']
+    difficulty = st.session_state['mcq_difficulty']
+    tasks = {
+        'summary': lambda: ask_documents(summary_query, summary_query),
+        'mcq': lambda: serve_mcq(n, difficulty, 4),
+    }
+    with st.status("요약과 문제를 생성 중...", expanded=True) as status:
+        for name, result, error in run_parallel(tasks):
+            if name == 'summary':
+                if error is not None:
+                    st.error(f"요약 생성 중 오류 발생: {error}")
+                else:
+                    st.session_state['summary_text'] = result
+                    st.write("✅ 요약이 생성되었습니다.")
+            else:
+                if error is not None:
+                    st.error(f"LLM 호출 중 오류가 발생했습니다: {error}")
+                    continue
+                questions = result
+                if questions:
+                    st.session_state['mcq_questions'] = questions
+                    st.session_state['mcq_user_answers'] = {}
+                    st.write(f"✅ 문제 {len(questions)}개가 생성되었습니다.")
+        status.update(label="생성 완료", state="complete", expanded=False)
+
 # 요약 보여주기 (이미 생성되어 있으면)
 if st.session_state.get('summary_text'):
     st.subheader(f"--요약 ({st.session_state['summary_sentences']}문장)--")
@@ -212,50 +246,55 @@ if create_mcq:
 
 # ------------------------
 # 생성된 문제 표시 및 채점
+# 보기 선택/채점은 이 영역만 다시 실행 (문서 처리·요약 등 페이지 전체를 다시 실행하지 않음)
 # ------------------------
-if st.session_state.get('mcq_questions'):
-    st.subheader(f"--생성된 객관식 문제 ({len(st.session_state['mcq_questions'])}문항)--")
-    questions = st.session_state['mcq_questions']
-
-    for i, q in enumerate(questions):
-        st.markdown(f"**문제 {i+1}.** {q['question']}")
-        choices = q['choices']
-        labelled = [f"{chr(65 + j)}. {choices[j]}" for j in range(len(choices))]
-        key = f"mcq_select_{i}"
-        default_index = st.session_state['mcq_user_answers'].get(key, None)
-        try:
-            radio_index = default_index if default_index is not None else 0
-            selected = st.radio("", labelled, index=radio_index, key=key)
-        except Exception:
-            selected = st.radio("", labelled, key=key)
-        selected_index = labelled.index(selected)
-        st.session_state['mcq_user_answers'][key] = selected_index
-        st.markdown("---")
-
-    if st.button("제출 및 채점"):
-        total = len(questions)
-        correct_count = 0
-        st.subheader("채점 결과")
+@st.fragment
+def quiz_section():
+    if st.session_state.get('mcq_questions'):
+        st.subheader(f"--생성된 객관식 문제 ({len(st.session_state['mcq_questions'])}문항)--")
+        questions = st.session_state['mcq_questions']
+
         for i, q in enumerate(questions):
-            user_idx = st.session_state['mcq_user_answers'].get(f"mcq_select_{i}", None)
+            st.markdown(f"**문제 {i+1}.** {q['question']}")
+            choices = q['choices']
+            labelled = [f"{chr(65 + j)}. {choices[j]}" for j in range(len(choices))]
+            key = f"mcq_select_{i}"
+            default_index = st.session_state['mcq_user_answers'].get(key, None)
             try:
-                correct_idx = int(q['answer'])
+                radio_index = default_index if default_index is not None else 0
+                selected = st.radio("", labelled, index=radio_index, key=key)
             except Exception:
-                st.error(f"{i+1}번 문항의 정답 인덱스가 올바르지 않습니다: {q.get('answer')}")
-                continue
-
-            choices = q['choices']
-            user_text = choices[user_idx] if (user_idx is not None and 0 <= user_idx < len(choices)) else "선택 없음"
-            correct_text = choices[correct_idx] if 0 <= correct_idx < len(choices) else "정답 데이터 오류"
-            if user_idx == correct_idx:
-                correct_count += 1
-                st.success(f"문제 {i+1}: 정답 ({chr(65+correct_idx)}). {correct_text}")
-            else:
-                user_letter = chr(65+user_idx) if user_idx is not None else '-'
-                st.error(f"문제 {i+1}: 오답 — 선택: {user_letter} {user_text} / 정답: {chr(65+correct_idx)} {correct_text}")
-            st.markdown(f"**해설:** {q.get('explanation','(해설 없음)')}")
+                selected = st.radio("", labelled, key=key)
+            selected_index = labelled.index(selected)
+            st.session_state['mcq_user_answers'][key] = selected_index
             st.markdown("---")
-        st.info(f"총점: {correct_count} / {total}")
+
+        if st.button("제출 및 채점"):
+            total = len(questions)
+            correct_count = 0
+            st.subheader("채점 결과")
+            for i, q in enumerate(questions):
+                user_idx = st.session_state['mcq_user_answers'].get(f"mcq_select_{i}", None)
+                try:
+                    correct_idx = int(q['answer'])
+                except Exception:
+                    st.error(f"{i+1}번 문항의 정답 인덱스가 올바르지 않습니다: {q.get('answer')}")
+                    continue
+
+                choices = q['choices']
+                user_text = choices[user_idx] if (user_idx is not None and 0 <= user_idx < len(choices)) else "선택 없음"
+                correct_text = choices[correct_idx] if 0 <= correct_idx < len(choices) else "정답 데이터 오류"
+                if user_idx == correct_idx:
+                    correct_count += 1
+                    st.success(f"문제 {i+1}: 정답 ({chr(65+correct_idx)}). {correct_text}")
+                else:
+                    user_letter = chr(65+user_idx) if user_idx is not None else '-'
+                    st.error(f"문제 {i+1}: 오답 — 선택: {user_letter} {user_text} / 정답: {chr(65+correct_idx)} {correct_text}")
+                st.markdown(f"**해설:** {q.get('explanation','(해설 없음)')}")
+                st.markdown("---")
+            st.info(f"총점: {correct_count} / {total}")
+
+quiz_section()
 
 # ------------------------
 # 파일 다운로드 / 초기화 섹션 (선택사항)
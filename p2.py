@@ -1,6 +1,10 @@
 import streamlit as st
 
-from MyLCH import get_pdf_text, get_text_chunks, get_vectorstore, get_conversation_chain
+from MyLCH import load_document_index, get_conversation_chain, RollingChatMemory, StreamlitWriter
+from MyTelemetry import set_page
+
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p2")
 
 st.markdown("# 학습자료로 질문하기")
 st.sidebar.markdown("다양한 형식의 학습 자료를 업로드한 후 이에 대해 질문할 수 있습니다.")
@@ -9,14 +13,11 @@ user_uploads = st.file_uploader("파일을 업로드해주세요", accept_multip
 if user_uploads is not None:
     if st.button("Upload"):
         with st.spinner("처리중.."):
-            # PDF 텍스트 가져오기
-            raw_text = get_pdf_text(user_uploads)
-            # 텍스트에서 청크 검색
-            text_chunks = get_text_chunks(raw_text)
-            # PDF 텍스트 저장을 위해 FAISS 벡터 저장소 만들기
-            vectorstore = get_vectorstore(text_chunks)
-            # 대화 체인 만들기
+            # PDF 텍스트 추출 → 청크 분할 → FAISS 벡터 저장소 (이미 처리한 파일이면 저장된 인덱스 재사용)
+            _, vectorstore = load_document_index(user_uploads)
+            # 대화 체인 만들기 (새 자료를 올리면 대화 기록도 새로 시작)
             st.session_state.conversation = get_conversation_chain(vectorstore)
+            st.session_state.chat_memory = RollingChatMemory()
 
 
 # In[12]:
@@ -24,13 +25,16 @@ if user_uploads is not None:
 
 if user_query := st.chat_input("질문을 입력해주세요~"):
     # 대화 체인을 사용하여 사용자의 메시지를 처리
-    if 'conversation' in st.session_state:
-        result = st.session_state.conversation({
-            "question": user_query,
-            "chat_history": st.session_state.get('chat_history', [])
-        })
-        response = result["answer"]
-    else:
-        response = "먼저 문서를 업로드해주세요."
     with st.chat_message("assistant"):
-        st.write(response)
\ No newline at end of file
+        if 'conversation' in st.session_state:
+            # 답변 토큰을 받는 즉시 화면에 출력
+            writer = StreamlitWriter(page="p2")
+            memory = st.session_state.setdefault('chat_memory', RollingChatMemory())
+            result = st.session_state.conversation({
+                "question": user_query,
+                "chat_history": memory.as_text()  # 최근 대화 + 오래된 대화의 요약 (토큰 예산 안)
+            }, callbacks=[writer])
+            writer.finish(result["answer"])
+            memory.add_turn(user_query, result["answer"])
+        else:
+            st.write("먼저 문서를 업로드해주세요.")
\ No newline at end of file
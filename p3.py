@@ -2,11 +2,15 @@
 import os
 from pathlib import Path
 import uuid
-import re
 import streamlit as st
 
-from openai import OpenAI  # openai>=1.0.0
-from MyLCH import getOpenAI  # 기존 프로젝트의 LLM 래퍼 (요약용)
+from MyLCH import getOpenAIStream, stream_predict, summarize_hierarchical  # 기존 프로젝트의 LLM 래퍼 (요약용)
+from MyLLM import split_into_sentences, transcribe_long_audio
+from MyProgress import StageProgress, ProgressCallbackHandler
+from MyTelemetry import set_page
+
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p3")
 
 # ---------- 설정 ----------
 st.markdown("# 녹음 내용 요약하기")
@@ -18,8 +22,8 @@ if not OPENAI_API_KEY:
     st.error("환경변수 OPENAI_API_KEY가 설정되어 있지 않습니다. 먼저 API 키를 설정해주세요.")
     st.stop()
 
-# OpenAI v1 클라이언트 생성
-client = OpenAI(api_key=OPENAI_API_KEY)
+# 긴 녹음을 동시에 전사할 구간 수
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "4"))
 
 # 저장 디렉터리
 AUDIO_DIR = Path("audio")
@@ -37,47 +41,18 @@ def save_uploaded_file(uploaded_file) -> Path:
         f.write(uploaded_file.read())
     return save_path
 
-def transcribe_file_with_openai(path: Path) -> str | None:
+def transcribe_file_with_openai(path: Path, on_progress=None) -> str | None:
     """
     OpenAI v1 client 를 사용한 Whisper 전사.
+    긴 녹음은 구간으로 나누어 동시에 전사한 뒤 순서대로 이어붙임.
     성공 시 전사 텍스트 반환, 실패 시 None.
     """
     try:
-        with open(path, "rb") as f:
-            resp = client.audio.transcriptions.create(
-                file=f,
-                model="whisper-1"
-            )
-        # 응답에서 텍스트 획득 (dict 또는 객체 형태 가능)
-        transcript = None
-        if isinstance(resp, dict) and "text" in resp:
-            transcript = resp["text"]
-        else:
-            transcript = getattr(resp, "text", None)
-        return transcript
+        return transcribe_long_audio(path, max_workers=TRANSCRIBE_WORKERS, on_progress=on_progress)
     except Exception as e:
         st.error(f"전사 중 오류 발생: {e}")
         return None
 
-def split_into_sentences(text: str) -> list[str]:
-    """
-    간단한 문장 분리기.
-    영어/한국어/일본어 등에서 기본 문장부호로 분리.
-    (정교한 분할이 필요하면 별도 라이브러리 사용 권장)
-    """
-    if not text:
-        return []
-    # 연속 공백 제거
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    # 분할 패턴: 영어/일본어/중국어/한글 문장종결부호 + 공백
-    # 또한 한국어 종결형태(다.|요.|습니다.|습니까.) 뒤 공백도 고려
-    pattern = r'(?<=[\.\?\!。！？\?])\s+|(?<=다\.)\s+|(?<=요\.)\s+|(?<=습니다\.)\s+|(?<=습니까\.)\s+'
-    parts = re.split(pattern, text)
-    # trim and remove empty
-    sentences = [p.strip() for p in parts if p and p.strip()]
-    return sentences
-
 def call_llm_for_summary(llm, prompt: str) -> str | None:
     """
     프로젝트의 getOpenAI()로 얻은 LLM 래퍼를 여러 방식으로 호출해 요약 텍스트를 얻음.
@@ -141,12 +116,27 @@ with col1:
         else:
             chosen_path = Path(st.session_state['saved_audio_path'])
             st.info(f"전사 시작: {chosen_path}")
-            transcript = transcribe_file_with_openai(chosen_path)
+            transcribe_stages = [
+                ("split", "오디오 구간 나누는 중...", 1),
+                ("transcribe", "구간 전사 중...", 8),
+                ("sentences", "문장 나누는 중...", 1),
+            ]
+            with StageProgress(transcribe_stages) as progress:
+                progress.stage("split")
+
+                def show_transcribe_progress(done, total):
+                    if done == 0:
+                        progress.stage("transcribe")
+                    progress.advance(done / total, label=f"구간 전사 {done}/{total}")
+
+                transcript = transcribe_file_with_openai(chosen_path, on_progress=show_transcribe_progress)
+                if transcript is not None:
+                    progress.stage("sentences")
+                    sentences = split_into_sentences(transcript)
             if transcript is None:
                 st.error("전사에 실패했습니다.")
             else:
                 st.session_state['transcript_text'] = transcript
-                sentences = split_into_sentences(transcript)
                 st.session_state['sentences'] = sentences
                 st.success("전사 및 문장화 완료.")
 
@@ -175,26 +165,45 @@ if st.button("요약 생성"):
         st.error("먼저 전사(문장화)를 실행하세요.")
     else:
         # LLM 호출
-        st.info("요약 생성 중...")
         try:
-            llm = getOpenAI()
+            llm = getOpenAIStream()
         except Exception as e:
-            st.error(f"getOpenAI() 호출 실패: {e}")
+            st.error(f"getOpenAIStream() 호출 실패: {e}")
             llm = None
 
         if llm is None:
             st.error("LLM이 준비되지 않았습니다.")
         else:
-            prompt = (
-                f"아래는 음성 전사 텍스트입니다. 한국어로 핵심을 추려서 "
-                f"간결하게 {summary_sentences}문장으로 요약해 주세요.\n\n"
-                f"{st.session_state['transcript_text']}"
-            )
-            summary = call_llm_for_summary(llm, prompt)
+            summary_stages = [
+                ("condense", "긴 전사 내용을 구간별로 정리하는 중...", 3),
+                ("request", "요약 요청 중...", 1),
+                ("tokens", "요약 생성 중...", 4),
+            ]
+            with StageProgress(summary_stages) as progress:
+                # 긴 전사 텍스트는 구간별로 동시에 요약한 뒤 합쳐서 프롬프트 크기를 맞춤 (잘라내지 않음)
+                progress.stage("condense")
+                summary = None
+                try:
+                    transcript_for_prompt = summarize_hierarchical(st.session_state['transcript_text'], target_tokens=6000)
+                except Exception as e:
+                    st.error(f"긴 전사 내용을 정리하는 중 오류가 발생했습니다: {e}")
+                    transcript_for_prompt = None
+                if transcript_for_prompt is not None:
+                    prompt = (
+                        f"아래는 음성 전사 텍스트입니다. 한국어로 핵심을 추려서 "
+                        f"간결하게 {summary_sentences}문장으로 요약해 주세요.\n\n"
+                        f"{transcript_for_prompt}"
+                    )
+                    try:
+                        # 토큰을 받는 대로 출력하고, 완료되면 아래 요약 영역에 표시
+                        summary = stream_predict(prompt, page="p3", keep=False, llm=llm,
+                                                 callbacks=[ProgressCallbackHandler(progress)])
+                    except Exception:
+                        summary = call_llm_for_summary(llm, prompt)
             if summary:
                 st.session_state['summary_text'] = summary
                 st.success("요약 생성 완료.")
-            else:
+            elif transcript_for_prompt is not None:
                 st.error("LLM 호출로 요약을 생성하지 못했습니다.")
 
 if st.session_state.get('summary_text'):
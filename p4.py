@@ -1,9 +1,12 @@
 import streamlit as st
 from langchain_core.prompts import PromptTemplate
-from MyLCH import getOpenAI
+from MyLCH import getOpenAI, getOpenAIStream, select_passages, stream_predict
+from MyLLM import run_parallel
+from MyTelemetry import set_page
+from MyWeb import fetch_many
 
-import requests
-from bs4 import BeautifulSoup
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p4")
 
 st.markdown("# 설명문 보기")
 st.sidebar.markdown("주제를 정하면 설명문을 작성하여 보여줍니다. 주제에 대해 정확히 알아가는 데 도움이 될 수 있습니다.")
@@ -32,10 +35,11 @@ with col2:
         include_examples = st.checkbox("실용적 예시 포함", value=True)
         include_next_steps = st.checkbox("다음 학습/연구 단계 제안", value=True)
 
-# 참고문헌 URL 입력란 (체크하면 나타남)
-ref_url = ""
+# 참고문헌 URL 입력란 (체크하면 나타남, 한 줄에 하나씩 여러 개 입력 가능)
+ref_urls = []
 if use_reference:
-    ref_url = st.text_input("참고문헌 URL을 입력하세요 (예: https://example.com/article)", value="", placeholder="https://")
+    ref_text = st.text_area("참고문헌 URL을 한 줄에 하나씩 입력하세요 (예: https://example.com/article)", value="", placeholder="https://")
+    ref_urls = [line.strip() for line in ref_text.splitlines() if line.strip()]
 
 st.markdown("---")
 
@@ -65,31 +69,6 @@ prompt = PromptTemplate(
     template=query_template,
 )
 
-# --- helper: URL에서 텍스트 추출 시도 ---
-def fetch_text_from_url(url: str, max_chars: int = 30000):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0 (compatible; StreamlitApp/1.0)"}
-        resp = requests.get(url, timeout=10, headers=headers)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        # 스크립트/스타일 제거
-        for s in soup(["script", "style", "noscript"]):
-            s.decompose()
-        article = soup.find("article")
-        if article:
-            text = article.get_text(separator="\n")
-        else:
-            # 본문이 없으면 전체 텍스트(간단 정리)
-            text = soup.get_text(separator="\n")
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        text = "\n".join(lines)
-        if len(text) > max_chars:
-            text = text[:max_chars] + "\n...[본문 생략: 길이 제한]..."
-        return text
-    except Exception as e:
-        # 실패 시 None 반환 (프롬프트에 URL만 전달)
-        return None
-
 # 생성 버튼 (설명은 버튼을 눌렀을 때만 생성됨)
 generate = st.button("설명 생성", key="generate_btn")
 
@@ -98,26 +77,38 @@ if generate:
     if not topic:
         st.info("먼저 설명할 주제를 입력하세요.")
     else:
-        llm = getOpenAI()
-        # 참고문헌이 있으면 시도해서 본문 가져오기
+        llm = getOpenAIStream()
+        # 참고문헌이 있으면 동시에 가져오기 (이전에 가져온 페이지는 캐시 사용)
         reference_instr = "참고문헌을 사용하지 않습니다."
-        if use_reference and ref_url:
+        if use_reference and ref_urls:
             st.info("참고문헌에서 내용을 가져오는 중입니다...")
-            fetched = fetch_text_from_url(ref_url)
+            results = fetch_many(ref_urls)
+            fetched = [r for r in results if r["text"]]
+            failed = [r for r in results if not r["text"]]
+            for r in failed:
+                st.warning(f"본문을 가져오지 못했습니다: {r['url']} ({r.get('error', '본문 없음')})")
             if fetched:
+                # 본문 전체 대신 주제와 관련된 구절만 토큰 예산 안에서 골라 넣음
+                passages = select_passages(topic, [r["text"] for r in fetched])
+                sources = "\n".join(f"[출처 {n}] {r['url']}" for n, r in enumerate(fetched, 1))
+                blocks = "\n\n".join(
+                    f"[출처 {p['source'] + 1}, {p['start']}-{p['end']}자]\n{p['text']}" for p in passages
+                )
                 # 프롬프트에 참고문헌 내용을 포함시키기 (LLM이 반드시 참고하도록 명시)
-                reference_instr = ("아래 '참고문헌(추출된 본문)'을 반드시 참고하여, 해당 내용이 설명에 반영되도록 하세요.\n\n"
-                                   "=== 참고문헌(추출된 본문 시작) ===\n"
-                                   f"{fetched}\n"
-                                   "=== 참고문헌(추출된 본문 끝) ===\n"
-                                   f"원문 출처: {ref_url}\n"
-                                   "위 출처의 사실과 주장에 충실하되, 필요하면 정리·요약하여 제시하세요.")
-            else:
+                reference_instr = ("아래 '참고문헌(주제와 관련된 구절)'을 반드시 참고하여, 해당 내용이 설명에 반영되도록 하세요.\n\n"
+                                   f"=== 출처 목록 ===\n{sources}\n\n"
+                                   f"=== 참고문헌(주제와 관련된 구절 시작) ===\n{blocks}\n"
+                                   "=== 참고문헌(주제와 관련된 구절 끝) ===\n"
+                                   "위 출처의 사실과 주장에 충실하되, 필요하면 정리·요약하여 제시하세요. "
+                                   "참고문헌에서 가져온 내용에는 문장 끝에 [출처 번호]를 표시하세요.")
+            if failed:
                 # 본문 추출 실패 — URL만 프롬프트에 전달
-                reference_instr = (f"참고문헌 본문을 자동으로 가져오지 못했습니다. 아래 URL을 참고문헌으로 사용하되, 모델이 자체적으로 해당 URL을 탐색/참조할 수 없을 수 있음을 염두에 두세요.\n"
-                                   f"참고문헌 URL: {ref_url}\n"
-                                   "가능하면 URL의 핵심 내용을 간단히 반영하여 설명을 구성하세요.")
-        elif use_reference and not ref_url:
+                failed_urls = "\n".join(r["url"] for r in failed)
+                reference_instr = ("" if not fetched else reference_instr + "\n\n") + (
+                    "다음 참고문헌은 본문을 자동으로 가져오지 못했습니다. 아래 URL을 참고문헌으로 사용하되, 모델이 자체적으로 해당 URL을 탐색/참조할 수 없을 수 있음을 염두에 두세요.\n"
+                    f"참고문헌 URL:\n{failed_urls}\n"
+                    "가능하면 URL의 핵심 내용을 간단히 반영하여 설명을 구성하세요.")
+        elif use_reference and not ref_urls:
             st.warning("참고문헌 사용이 선택되었지만 URL이 비어 있습니다. URL을 입력하거나 참고문헌 사용을 해제하세요.")
             st.session_state['last_response'] = None
 
@@ -134,7 +125,8 @@ if generate:
         # LLM 호출
         try:
             with st.spinner("설명 생성 중..."):
-                response = llm.predict(prompt_text)
+                # 토큰을 받는 대로 출력하고, 완료되면 아래 설명 영역에 표시
+                response = stream_predict(prompt_text, page="p4", keep=False, llm=llm)
                 # 새 설명이 생성되면 이전 요약/체크리스트 초기화
                 st.session_state['last_response'] = response
                 st.session_state.pop('summary', None)
@@ -152,34 +144,52 @@ if st.session_state.get('last_response'):
     st.markdown("---")
     st.markdown("### 빠른 액션")
 
-    # -- 요약 생성 버튼 (결과는 session_state['summary']에 저장) --
-    if st.button("요약 추출 (150자 이내)", key="summary_btn"):
-        try:
-            llm = getOpenAI()
-            summary_prompt = f"다음 내용을 150자 이내로 한국어로 요약하세요:\n\n{response}"
-            summary = llm.predict(summary_prompt)
-            st.session_state['summary'] = summary
-        except Exception as e:
-            st.error(f"요약 중 오류: {e}")
-
-    # -- 체크리스트 생성 버튼 (결과는 session_state['checklist']에 저장) --
-    if st.button("학습 체크리스트 생성", key="checklist_btn"):
-        try:
-            llm = getOpenAI()
-            checklist_prompt = f"다음 설명을 바탕으로 실제로 따라할 수 있는 학습 체크리스트(5단계 이내)를 한국어로 작성하세요:\n\n{response}"
-            checklist = llm.predict(checklist_prompt)
-            st.session_state['checklist'] = checklist
-        except Exception as e:
-            st.error(f"체크리스트 생성 중 오류: {e}")
-
-    # -- 저장된 요약/체크리스트를 둘 다 보여줌 --
-    if st.session_state.get('summary'):
-        st.markdown("#### 요약 (150자 이내)")
-        st.write(st.session_state['summary'])
-
-    if st.session_state.get('checklist'):
-        st.markdown("#### 학습 체크리스트")
-        st.write(st.session_state['checklist'])
+    # 빠른 액션 정의: {세션 키: (제목, 프롬프트, 오류 메시지)}
+    quick_actions = {
+        'summary': ("요약 (150자 이내)",
+                    f"다음 내용을 150자 이내로 한국어로 요약하세요:\n\n{response}",
+                    "요약 중 오류"),
+        'checklist': ("학습 체크리스트",
+                      f"다음 설명을 바탕으로 실제로 따라할 수 있는 학습 체크리스트(5단계 이내)를 한국어로 작성하세요:\n\n{response}",
+                      "체크리스트 생성 중 오류"),
+    }
+
+    b1, b2, b3 = st.columns(3)
+    with b1:
+        summary_clicked = st.button("요약 추출 (150자 이내)", key="summary_btn")
+    with b2:
+        checklist_clicked = st.button("학습 체크리스트 생성", key="checklist_btn")
+    with b3:
+        # 요약과 체크리스트를 동시에 생성
+        all_clicked = st.button("모두 생성", key="all_btn")
+
+    # 결과 표시 영역 (결과는 session_state['summary'], session_state['checklist']에 저장)
+    areas = {name: st.empty() for name in quick_actions}
+
+    def show_quick_action(name):
+        if st.session_state.get(name):
+            with areas[name].container():
+                st.markdown(f"#### {quick_actions[name][0]}")
+                st.write(st.session_state[name])
+
+    tasks = {}
+    if summary_clicked or all_clicked:
+        tasks['summary'] = lambda: getOpenAI().predict(quick_actions['summary'][1])
+    if checklist_clicked or all_clicked:
+        tasks['checklist'] = lambda: getOpenAI().predict(quick_actions['checklist'][1])
+
+    # -- 저장된 요약/체크리스트를 둘 다 보여줌 (새로 생성 중인 항목은 끝나는 대로 표시) --
+    for name in quick_actions:
+        if name not in tasks:
+            show_quick_action(name)
+    if tasks:
+        with st.spinner("생성 중..."):
+            for name, result, error in run_parallel(tasks):
+                if error is not None:
+                    st.error(f"{quick_actions[name][2]}: {error}")
+                    continue
+                st.session_state[name] = result
+                show_quick_action(name)
 
 else:
     st.info("주제와 옵션을 입력한 뒤 '설명 생성' 버튼을 누르세요.")
\ No newline at end of file
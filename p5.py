@@ -1,23 +1,19 @@
 import streamlit as st
-from langchain.chains.conversation.base import ConversationChain
-from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import HumanMessage, SystemMessage
 from streamlit_chat import message
-from MyLCH import getOpenAI  # 사용자의 LLM 래퍼
+from MyLCH import getOpenAIStream, RollingChatMemory, StreamlitWriter  # 사용자의 LLM 래퍼
+from MyTelemetry import set_page
+
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p5")
 
 st.markdown("# 채팅하기")
 st.sidebar.markdown("학습한 내용을 주제로 토론/토의하며 지식을 확장해요")
 
 # --- 세션 상태 초기화(일관된 키 사용) ---
+# 최근 대화는 그대로, 오래된 대화는 요약으로 유지 (프롬프트 크기가 일정 수준에서 멈춤)
 if 'memory' not in st.session_state:
-    st.session_state['memory'] = ConversationBufferMemory(return_messages=True)
-
-if 'conv_chain' not in st.session_state:
-    # LLM 객체는 세션 안에 보관(같은 프로세스 내에서만 유효)
-    st.session_state['conv_chain'] = ConversationChain(
-        llm=getOpenAI(),
-        memory=st.session_state['memory'],
-        verbose=False
-    )
+    st.session_state['memory'] = RollingChatMemory()
 
 if 'chat_past' not in st.session_state:
     st.session_state['chat_past'] = ["안녕하세요!"]  # 사용자 발화(초기값은 대화 시작 프롬프트와 맞추기 위함)
@@ -31,17 +27,15 @@ if 'mode' not in st.session_state:
 
 # --- 세션 초기화(메모리 리셋) 버튼 ---
 if st.sidebar.button("대화 초기화 (메모리 삭제)"):
-    st.session_state['memory'] = ConversationBufferMemory(return_messages=True)
-    st.session_state['conv_chain'] = ConversationChain(
-        llm=getOpenAI(),
-        memory=st.session_state['memory'],
-        verbose=False
-    )
+    st.session_state['memory'].clear()
     st.session_state['chat_past'] = ["안녕하세요!"]
     st.session_state['chat_generated'] = ["안녕하세요! 어떤 주제로 이야기를 해볼까요?"]
     st.session_state['mode'] = None
     st.success("대화와 메모리가 초기화되었습니다.")
 
+# --- 기본 시스템 지침 ---
+BASE_INSTRUCTION = "당신은 사용자의 학습을 돕는 친절한 AI입니다. 이전 대화의 맥락을 이어서 자세히 답하고, 모르는 내용은 모른다고 솔직하게 답하세요."
+
 # --- 모드 정의(시스템/진행 지침) ---
 MODE_INSTRUCTIONS = {
     'research': '''주제별 연구 모드 시작
@@ -70,19 +64,14 @@ st.markdown("**모드 선택 — 빠른 시작 버튼**")
 col1, col2, col3 = st.columns([1,1,2])
 with col1:
     if st.button("주제별 연구"):
-        # 모드 설정 및 메모리에 모드 지침 저장
+        # 모드 설정 (모드 지침은 매 요청의 시스템 지침으로 들어감)
         st.session_state['mode'] = 'research'
-        instr = MODE_INSTRUCTIONS['research']
-        # 메모리에 모드 설정을 기록(나중에 체인이 참조할 수 있도록)
-        st.session_state['memory'].save_context({"mode_set": "research"}, {"assistant": instr})
-        # 사용자와 봇 히스토리에도 가시적으로 추가
+        # 사용자와 봇 히스토리에 가시적으로 추가
         st.session_state['chat_past'].append("[모드 선택] 주제별 연구")
         st.session_state['chat_generated'].append("주제별 연구 모드로 전환했습니다. 연구할 주제를 입력해주세요.")
 with col2:
     if st.button("주제 토론"):
         st.session_state['mode'] = 'debate'
-        instr = MODE_INSTRUCTIONS['debate']
-        st.session_state['memory'].save_context({"mode_set": "debate"}, {"assistant": instr})
         st.session_state['chat_past'].append("[모드 선택] 주제 토론")
         st.session_state['chat_generated'].append("주제 토론 모드로 전환했습니다. 토론할 주제를 입력해주세요.")
 with col3:
@@ -98,20 +87,23 @@ with col3:
             st.session_state['chat_past'].append("[모드 해제]")
             st.session_state['chat_generated'].append("모드를 해제했습니다. 일반 대화로 돌아갑니다.")
 
-# --- 채팅 함수(세션 내 체인 사용, 메모리에 자동 저장) ---
+# --- 채팅 함수: [시스템 지침(+모드)] + [요약/최근 대화] + [질문] 으로 프롬프트 구성 ---
+def build_messages(user_query: str):
+    system = BASE_INSTRUCTION
+    if st.session_state['mode'] in MODE_INSTRUCTIONS:
+        # 모드 지침은 대화 기록이 아니라 고정된 시스템 지침으로 한 번만 넣음
+        system += "\n\n" + MODE_INSTRUCTIONS[st.session_state['mode']]
+    return [SystemMessage(content=system)] + st.session_state['memory'].as_messages() + [HumanMessage(content=user_query)]
+
 def conversational_chat(user_query: str) -> str:
-    chain: ConversationChain = st.session_state['conv_chain']
+    memory: RollingChatMemory = st.session_state['memory']
     try:
-        # 모드가 설정된 경우, 간단한 프롬프트 어프로치로 체인에 모드 상태를 반영할 수 있도록 메모리에 저장
-        if st.session_state['mode'] == 'research':
-            # 연구 모드일 때: 사용자가 주제를 처음 제시하면 체인에게 연구자 관점에서 접근하라고 알려줌
-            # 메모리에 현재 모드 정보를 저장하면 이후 대화에서 참조될 수 있음
-            st.session_state['memory'].save_context({"user": user_query}, {"assistant": "사용자가 주제를 제시함. 연구자 관점에서 응답할 것."})
-        elif st.session_state['mode'] == 'debate':
-            st.session_state['memory'].save_context({"user": user_query}, {"assistant": "사용자가 토론 주제를 제시함. 토론자 및 진행자 관점에서 응답할 것."})
-
-        # 기본적으로 체인에 유저 입력을 넣어 예측
-        response = chain.predict(input=user_query)
+        # 토큰을 받는 대로 화면에 출력
+        writer = StreamlitWriter(page="p5")
+        answer = getOpenAIStream().invoke(build_messages(user_query), config={"callbacks": [writer]})
+        response = writer.finish(answer.content, keep=False)
+        # 메모리 갱신 (예산을 넘으면 오래된 대화는 백그라운드에서 요약됨)
+        memory.add_turn(user_query, response)
     except Exception as e:
         response = f"오류가 발생했습니다: {e}"
     # 세션 채팅 히스토리 갱신
@@ -119,36 +111,50 @@ def conversational_chat(user_query: str) -> str:
     st.session_state['chat_generated'].append(response)
     return response
 
-# --- UI: 입력 폼 ---
-response_container = st.container()
-container = st.container()
-
-with container:
-    with st.form(key='Conv_Question', clear_on_submit=True):
-        user_input = st.text_input("Query:", placeholder="무엇이든 물어보세요 🙂", key='input')
-        submit_button = st.form_submit_button(label='Send')
-
-    if submit_button and user_input:
-        with st.spinner("응답 생성 중..."):
-            conversational_chat(user_input)
-
-# --- 대화 출력(저장된 세션 히스토리 사용) ---
-if st.session_state['chat_generated']:
-    with response_container:
-        # chat_past와 chat_generated의 길이가 같은지 안전 검사
-        n = min(len(st.session_state['chat_past']), len(st.session_state['chat_generated']))
-        for i in range(n):
-            # 사용자 메시지
-            message(st.session_state['chat_past'][i],
-                    is_user=True,
-                    key=f"user_{i}",
-                    avatar_style="fun-emoji",
-                    seed="Nala")
-            # 봇 메시지
-            message(st.session_state['chat_generated'][i],
-                    key=f"bot_{i}",
-                    avatar_style="bottts",
-                    seed="Fluffy")
+# 화면에 말풍선 컴포넌트로 그릴 최근 대화 수 (이전 대화는 접어서 텍스트로 표시)
+HISTORY_RENDER_LIMIT = 20
+
+# --- UI: 입력 폼 + 대화 출력 ---
+# 메시지를 보내면 이 영역만 다시 실행 (모드 버튼 등 페이지 나머지는 다시 그리지 않음)
+@st.fragment
+def chat_section():
+    response_container = st.container()
+    container = st.container()
+
+    with container:
+        with st.form(key='Conv_Question', clear_on_submit=True):
+            user_input = st.text_input("Query:", placeholder="무엇이든 물어보세요 🙂", key='input')
+            submit_button = st.form_submit_button(label='Send')
+
+        if submit_button and user_input:
+            with st.spinner("응답 생성 중..."):
+                conversational_chat(user_input)
+
+    # --- 대화 출력(저장된 세션 히스토리 사용) ---
+    if st.session_state['chat_generated']:
+        with response_container:
+            # chat_past와 chat_generated의 길이가 같은지 안전 검사
+            n = min(len(st.session_state['chat_past']), len(st.session_state['chat_generated']))
+            first = max(0, n - HISTORY_RENDER_LIMIT)
+            if first:
+                with st.expander(f"이전 대화 {first}개 보기"):
+                    for i in range(first):
+                        st.markdown(f"**나:** {st.session_state['chat_past'][i]}")
+                        st.markdown(f"**AI:** {st.session_state['chat_generated'][i]}")
+            for i in range(first, n):
+                # 사용자 메시지
+                message(st.session_state['chat_past'][i],
+                        is_user=True,
+                        key=f"user_{i}",
+                        avatar_style="fun-emoji",
+                        seed="Nala")
+                # 봇 메시지
+                message(st.session_state['chat_generated'][i],
+                        key=f"bot_{i}",
+                        avatar_style="bottts",
+                        seed="Fluffy")
+
+chat_section()
 
 # 추가 팁 표시
 st.sidebar.markdown("---")
@@ -1,6 +1,11 @@
 import streamlit as st
 
-from MyLLM import save_carpturefile, encode_image, openAiModel, progressBar, makeAudio
+from MyLLM import save_carpturefile, encode_image, stream_chat_completion, SpeechPipeline
+from MyProgress import StageProgress
+from MyTelemetry import set_page
+
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p6")
 
 # Sidebar
 st.sidebar.markdown("직접 사진을 촬영하여 관련된 정보를 살펴봅니다.")
@@ -15,26 +20,48 @@ if picture:
     text = st.text_area(label="질문입력:",  placeholder="질문을 입력 하세요")
 
     if st.button("SEND"):
-        base64img = encode_image("capture/capturetemp.png")
-        model = openAiModel()
-        my_bar = progressBar("Operation in progress. Please wait.")
-        response = model.chat.completions.create(
-            model='gpt-4o',
-            messages=[
-                {"role": "system", "content": "당신은 꼼꼼한 선생님입니다. 사진에 보이는 내용을 적절히 해석하여 도움이 될 만한 지식을 상세히 제공합니다."},
-                {"role": "user", "content": [
-                    {"type": "text", "text": text},
-                    {"type": "image_url", "image_url": {
-                        "url": f"data:image/jpg;base64,{base64img}"}
-                     }
-                ]}
-            ],
-            temperature=0.0,
-        )
-        my_bar.empty()
-
-        # 결과를 출력하고
-        # 음성으로 안내한다
-        st.info(response.choices[0].message.content)
-        makeAudio(response.choices[0].message.content, "img_capture_result.mp3")
-        st.audio("audio/img_capture_result.mp3", autoplay=True, width=1)
\ No newline at end of file
+        stages = [
+            ("encode", "이미지 인코딩 중...", 1),
+            ("request", "질문 전송 중...", 2),
+            ("tokens", "답변 받는 중...", 5),
+            ("tts", "음성 생성 중...", 2),
+        ]
+        answer_box = st.empty()
+        with StageProgress(stages) as progress:
+            progress.stage("encode")
+            base64img = encode_image("capture/capturetemp.png")
+
+            progress.stage("request")
+            stream = stream_chat_completion(
+                'gpt-4o',
+                [
+                    {"role": "system", "content": "당신은 꼼꼼한 선생님입니다. 사진에 보이는 내용을 적절히 해석하여 도움이 될 만한 지식을 상세히 제공합니다."},
+                    {"role": "user", "content": [
+                        {"type": "text", "text": text},
+                        {"type": "image_url", "image_url": {
+                            "url": f"data:image/jpg;base64,{base64img}"}
+                         }
+                    ]}
+                ],
+                temperature=0.0,
+                kind="vision",
+            )
+
+            # 받은 만큼 바로 출력하면서 진행률 갱신 (끝난 문장은 바로 음성 합성 시작)
+            # 스트리밍 도중 오류가 나도 합성 스레드 풀은 정리됨
+            with SpeechPipeline() as speech:
+                answer = ""
+                for n, delta in enumerate(stream, start=1):
+                    if n == 1:
+                        progress.stage("tokens")
+                    answer += delta
+                    speech.feed(delta)
+                    answer_box.info(answer + "▌")
+                    progress.advance(min(len(answer) / 1500, 0.95))
+
+                # 결과를 출력하고
+                # 음성으로 안내한다 (앞 문장들은 이미 합성되어 있어 마지막 구간만 기다림)
+                answer_box.info(answer)
+                progress.stage("tts")
+                speech.save("img_capture_result.mp3")
+        st.audio("audio/img_capture_result.mp3", autoplay=True, width=1)
@@ -1,20 +1,17 @@
 # study_planner_from_pdf_updated.py
 import streamlit as st
-import tempfile
-import json
-import re
 from datetime import datetime, timedelta, date
 import math
 import pandas as pd
 
-# PDF loader (langchain community)
-try:
-    from langchain_community.document_loaders import PyPDFLoader
-except Exception:
-    PyPDFLoader = None
-
 from langchain_core.prompts import PromptTemplate
-from MyLCH import getOpenAI
+from MyLCH import getOpenAI, getOpenAIStream, stream_predict, get_document_text, summarize_hierarchical
+from MyIndex import getDocIndexStore
+from MyLLM import extract_json_from_text
+from MyTelemetry import set_page
+
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p7")
 
 st.title("스터디 플래너")
 st.sidebar.markdown("학습자료 PDF를 업로드하면 스터디 플랜을 설계하여 표로 보여줍니다.")
@@ -28,22 +25,13 @@ with col_left:
     full_text = None
     num_pages = 0
     if uploaded_file:
-        if PyPDFLoader is None:
-            st.error("PyPDFLoader가 설치되어 있지 않습니다. 'langchain-community'를 설치하세요.")
-        else:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(uploaded_file.getvalue())
-                tmp_path = tmp.name
-            try:
-                loader = PyPDFLoader(tmp_path)
-                pages = loader.load()
-                num_pages = len(pages)
-                # 문서 전체를 그대로 사용(내부적으로 필요시 요약은 조용히 수행)
-                full_text = "\n\n".join([p.page_content for p in pages])
-                st.success(f"문서 로드 완료 — {num_pages} 페이지")
-
-            except Exception as e:
-                st.error(f"PDF 로드 실패: {e}")
+        try:
+            # 같은 파일이 이미 처리된 적 있으면 저장된 추출 텍스트 재사용
+            doc_digest, full_text = get_document_text([uploaded_file])
+            num_pages = (getDocIndexStore().get_meta(doc_digest) or {}).get("pages", 0)
+            st.success(f"문서 로드 완료 — {num_pages} 페이지")
+        except Exception as e:
+            st.error(f"PDF 로드 실패: {e}")
     else:
         st.info("먼저 PDF를 업로드하세요.")
 
@@ -75,29 +63,6 @@ with col_right:
     generate = st.button("스터디 플랜 생성")
 
 # ---------------- Helper functions ----------------
-def extract_json_from_text(text):
-    """
-    LLM의 응답에서 JSON 객체를 추출해 파싱 시도.
-    """
-    m = re.search(r'\{.*\}', text, flags=re.S)
-    if m:
-        candidate = m.group(0)
-        try:
-            return json.loads(candidate)
-        except Exception:
-            candidate2 = candidate.replace("'", "\"")
-            try:
-                return json.loads(candidate2)
-            except Exception:
-                return None
-    m2 = re.search(r'\[.*\]', text, flags=re.S)
-    if m2:
-        try:
-            return json.loads(m2.group(0))
-        except Exception:
-            return None
-    return None
-
 def generate_dates_by_view(start_date, end_date, plan_view, sessions_per_week=None, study_days_per_week=None):
     """
     plan_view에 따라 각 세션 날짜 목록 반환.
@@ -134,32 +99,16 @@ def generate_dates_by_view(start_date, end_date, plan_view, sessions_per_week=No
             cur = cur + timedelta(days=7)
         return dates
 
-def silent_summarize_if_needed(llm_client, full_text, max_chars=12000):
+def silent_summarize_if_needed(llm_client, full_text, max_tokens=6000):
     """
     내부적으로 (화면에 표시하지 않고) 요약해서 리턴.
-    - 만약 문서가 max_chars 이하이면 원문 반환.
-    - 초과하면 요약 프롬프트를 LLM에 보내 요약을 받고 반환한다. (요약 과정은 화면에 노출 X)
+    - 만약 문서가 max_tokens 이하이면 원문 반환.
+    - 초과하면 구간별로 동시에 요약한 뒤 합치는 과정을 반복해 max_tokens 이하로 줄인다.
+      (문서 일부를 잘라내지 않으며, 같은 구간의 요약은 캐시에서 재사용)
     """
     if not full_text:
         return ""
-    if len(full_text) <= max_chars:
-        return full_text
-    # 요약 프롬프트 (간단하게 중심 내용, 목차 추출)
-    sum_prompt = PromptTemplate(
-        input_variables=["doc_text"],
-        template=(
-            "다음 긴 문서를 핵심 항목(한두 문단 요약 + 핵심 섹션 제목 목록)으로 요약하시오. "
-            "출력은 요약문(한 문단)과 '-'로 시작하는 섹션명 목록으로 구성하시오.\n\n문서:\n{doc_text}"
-        )
-    )
-    try:
-        p = sum_prompt.format(doc_text=full_text)
-        summary = llm_client.predict(p)
-        # 요약 결과 자체가 LLM에 보낼 적절한 요약 텍스트로 사용
-        return summary
-    except Exception:
-        # 요약 실패 시에도 조용히 원문 일부라도 반환(최악).
-        return full_text[:12000]
+    return summarize_hierarchical(full_text, target_tokens=max_tokens, llm=llm_client)
 
 # ---------------- Generation logic ----------------
 if generate:
@@ -171,7 +120,12 @@ if generate:
         llm = getOpenAI()
 
         # 내부적으로 적절히 요약(사용자에게는 보이지 않음)
-        doc_for_prompt = silent_summarize_if_needed(llm, full_text)
+        try:
+            with st.spinner("문서를 정리하는 중입니다..."):
+                doc_for_prompt = silent_summarize_if_needed(llm, full_text)
+        except Exception as e:
+            st.error(f"문서 요약 중 오류가 발생했습니다: {e}")
+            st.stop()
 
         # 날짜 목록 생성 및 세션 수 결정
         if plan_view == "일간":
@@ -213,7 +167,9 @@ if generate:
                 depth=depth
             )
             with st.spinner("스터디 플랜을 생성 중입니다..."):
-                plan_text = llm.predict(plan_prompt)
+                # 생성 중인 플랜을 미리보기로 보여주고, 완료되면 표로 정리
+                with st.expander("생성 중인 플랜 미리보기", expanded=True):
+                    plan_text = stream_predict(plan_prompt, page="p7", keep=False, llm=getOpenAIStream())
         except Exception as e:
             st.error(f"스터디 플랜 생성 중 오류가 발생했습니다: {e}")
             plan_text = None
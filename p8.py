@@ -1,20 +1,44 @@
 import streamlit as st
 import datetime
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import Document
-from langchain.vectorstores import FAISS
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.chains import RetrievalQA
-
-# --- LangChain 초기화 ---
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-embeddings = OpenAIEmbeddings()
-
-# 세션 상태 초기화
-if "vectorstore" not in st.session_state:
-    st.session_state.vectorstore = None
-if "docs" not in st.session_state:
-    st.session_state.docs = []
+from MyMemo import getMemoStore
+from MyTelemetry import set_page
+
+# 이 페이지에서 일어나는 모델 호출을 페이지별로 집계
+set_page("p8")
+
+# 메모 저장/목록만 볼 때는 LangChain, 임베딩, FAISS 를 로드하지 않음 (질문할 때 처음 로드)
+memo_store = getMemoStore()
+
+# 질문 시 프롬프트에 넣을 최대 메모 수
+QA_TOP_K = 20
+# 화면에 보여줄 최근 메모 수
+LIST_LIMIT = 100
+
+# --- 사용자 선택 ---
+user = st.sidebar.text_input("사용자 이름", value="guest").strip() or "guest"
+
+def memo_documents(memos):
+    from langchain_core.documents import Document
+
+    return [Document(page_content=m["content"], metadata={"date": m["date"], "id": m["id"]}) for m in memos]
+
+def memo_index():
+    """
+    이 사용자의 메모 인덱스. 질문할 때 처음 만들고, 사용자나 임베딩 제공자가 바뀌면 다시 구성한다.
+    이미 임베딩한 메모는 임베딩 캐시에서 가져오므로 API 호출이 없음
+    """
+    from MyLCH import add_documents_by_id, embedding_tag
+
+    key = (user, embedding_tag())
+    if st.session_state.get("memo_index_key") != key:
+        memos = memo_store.list(user)
+        st.session_state.vectorstore = add_documents_by_id(None, memo_documents(memos), [m["id"] for m in memos]) if memos else None
+        st.session_state.memo_index_key = key
+    return st.session_state.vectorstore
+
+def memo_index_built():
+    # 이 세션에서 현재 사용자의 인덱스를 이미 만들었으면 저장/삭제를 바로 반영 (없으면 질문할 때 만듦)
+    return st.session_state.get("memo_index_key", (None,))[0] == user
 
 # --- Streamlit UI ---
 st.title("📅 달력에 메모하기")
@@ -27,50 +51,91 @@ date = st.date_input("날짜 선택", today)
 memo = st.text_area("메모 입력")
 if st.button("저장"):
     if memo.strip():
-        doc = Document(page_content=memo, metadata={"date": str(date)})
-        st.session_state.docs.append(doc)
-        st.session_state.vectorstore = FAISS.from_documents(st.session_state.docs, embeddings)
+        memo_id = memo_store.add(user, date, memo)
+        if memo_index_built():
+            from MyLCH import add_documents_by_id
+
+            # 새 메모 하나만 임베딩해서 인덱스에 추가
+            docs = memo_documents([{"id": memo_id, "date": str(date), "content": memo}])
+            st.session_state.vectorstore = add_documents_by_id(st.session_state.vectorstore, docs, [memo_id])
         st.success(f"{date} 메모 저장 완료!")
 
 # 전체 메모 보기
-st.subheader("📂 전체 메모")
-if st.session_state.docs:
-    for i, d in enumerate(st.session_state.docs):
+# 삭제 버튼은 이 목록 영역만 다시 실행 (페이지 전체 rerun 없음)
+@st.fragment
+def memo_list():
+    st.subheader("📂 전체 메모")
+    total = memo_store.count(user)
+    if not total:
+        st.info("아직 저장된 메모가 없습니다.")
+        return
+    if total > LIST_LIMIT:
+        st.caption(f"전체 {total}개 중 최근 {LIST_LIMIT}개를 표시합니다.")
+    for m in memo_store.list(user, limit=LIST_LIMIT, newest_first=True):
         col1, col2 = st.columns([8, 1])
         with col1:
-            st.markdown(f"**{d.metadata['date']}** : {d.page_content}")
+            st.markdown(f"**{m['date']}** : {m['content']}")
         with col2:
-            if st.button("🗑️", key=f"delete_{i}"):
-                # 삭제: 해당 문서 제거 후 vectorstore 재생성
-                st.session_state.docs.pop(i)
-                if st.session_state.docs:
-                    st.session_state.vectorstore = FAISS.from_documents(st.session_state.docs, embeddings)
-                else:
-                    st.session_state.vectorstore = None
-                st.rerun()   # ✅ 최신 Streamlit에서는 st.experimental_rerun() 대신 st.rerun() 사용
-else:
-    st.info("아직 저장된 메모가 없습니다.")
-
-from langchain_core.prompts import PromptTemplate
+            if st.button("🗑️", key=f"delete_{m['id']}"):
+                # 삭제: 저장소와 인덱스에서 id로 제거 (임베딩 재계산 없음)
+                memo_store.delete(user, m["id"])
+                if memo_index_built():
+                    from MyLCH import delete_documents_by_id
+
+                    st.session_state.vectorstore = delete_documents_by_id(st.session_state.vectorstore, [m["id"]])
+                st.rerun(scope="fragment")
+
+memo_list()
+total_memos = memo_store.count(user)
 
 # AI에게 질문
 st.subheader("❓ AI에게 질문하기")
 question = st.text_input("질문을 입력하세요")
+date_range = st.date_input(
+    "질문할 날짜 범위",
+    value=(today - datetime.timedelta(days=30), today + datetime.timedelta(days=30)),
+)
 if st.button("질문하기"):
     if question.strip():
-        if not st.session_state.docs:
+        if isinstance(date_range, (list, tuple)):
+            start, end = (date_range[0], date_range[-1]) if date_range else (None, None)
+        else:
+            start = end = date_range
+        start, end = str(start), str(end)
+        in_range = memo_store.count(user, start, end)
+        if not total_memos:
             st.warning("먼저 메모를 저장해주세요.")
+        elif not in_range:
+            st.warning("선택한 날짜 범위에 메모가 없습니다.")
         else:
-            # 모든 메모를 하나의 텍스트로 합치기
-            all_memos = "\n".join(
-                [f"- {d.metadata['date']}: {d.page_content}" for d in st.session_state.docs]
-            )
+            from langchain_core.prompts import PromptTemplate
+            from MyLCH import add_documents_by_id, getChatOpenAI, similarity_search_in_ids
+
+            # 1) 날짜 범위로 후보를 좁히고 2) 후보가 많으면 인덱스에서 그 후보들 중 질문과 유사한 상위 k개만 사용
+            if in_range <= QA_TOP_K:
+                selected = memo_store.list(user, start, end)
+            else:
+                ids = memo_store.ids(user, start, end)
+                index = memo_index()
+                # 다른 세션/탭에서 저장한 메모는 이 세션의 인덱스에 없으므로 그것만 id로 추가
+                known = set(index.index_to_docstore_id.values()) if index is not None else set()
+                missing = memo_store.get_many(user, [i for i in ids if i not in known])
+                if missing:
+                    docs = memo_documents(missing)
+                    index = st.session_state.vectorstore = add_documents_by_id(index, docs, [m["id"] for m in missing])
+                docs = similarity_search_in_ids(index, question, ids, k=QA_TOP_K)
+                selected = sorted(
+                    [{"date": d.metadata["date"], "content": d.page_content} for d in docs],
+                    key=lambda m: m["date"],
+                )
+            memo_lines = "\n".join([f"- {m['date']}: {m['content']}" for m in selected])
 
             # 프롬프트 템플릿 (예시코드(page7.py) 참고해서 설계)
             qa_template = PromptTemplate(
-                input_variables=["memos", "question"],
+                input_variables=["memos", "question", "start", "end", "in_range", "shown"],
                 template=(
                     "당신은 개인 비서입니다. 아래 달력 메모 내용을 참고하여 사용자의 질문에 답하세요.\n\n"
+                    "기간: {start} ~ {end} (이 기간의 메모는 총 {in_range}개이며, 그중 질문과 관련 있는 {shown}개를 보여줍니다)\n"
                     "메모 목록:\n{memos}\n\n"
                     "질문: {question}\n\n"
                     "규칙:\n"
@@ -81,10 +146,14 @@ if st.button("질문하기"):
                 )
             )
 
-            prompt = qa_template.format(memos=all_memos, question=question)
+            prompt = qa_template.format(
+                memos=memo_lines, question=question, start=start, end=end,
+                in_range=in_range, shown=len(selected),
+            )
 
             try:
-                answer = llm.predict(prompt)
+                # 모델은 프로세스 전체에서 공유 (rerun 마다 새로 만들지 않음)
+                answer = getChatOpenAI("gpt-4o-mini").predict(prompt)
                 st.write(answer)
             except Exception as e:
-                st.error(f"질문 처리 중 오류 발생: {e}")
\ No newline at end of file
+                st.error(f"질문 처리 중 오류 발생: {e}")
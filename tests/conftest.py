@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 저장소 최상위의 My*.py 모듈을 import 할 수 있도록
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
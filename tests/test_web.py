@@ -0,0 +1,117 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+try:
+    import lxml.html  # noqa: F401
+except ImportError:
+    pytest.importorskip("bs4")
+
+import MyCache
+import MyWeb
+
+PAGE = (
+    b"<html><head><script>var x = 1;</script><style>p {}</style></head>"
+    b"<body><nav>menu</nav><article><p>Hello</p><p>World</p></article></body></html>"
+)
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+SLOW_SECONDS = 0.3
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 서버 객체에 요청 기록을 남김: [(경로, If-None-Match, If-Modified-Since), ...]
+    def do_GET(self):
+        self.server.requests.append(
+            (self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since"))
+        )
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path.startswith("/slow"):
+            time.sleep(SLOW_SECONDS)
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def web_cache(tmp_path, monkeypatch):
+    # 테스트마다 빈 캐시 사용
+    monkeypatch.setattr(MyCache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(MyWeb, "_web_cache", None)
+
+
+def test_extract_text_drops_scripts_and_prefers_article():
+    assert MyWeb.extract_text(PAGE.decode()) == "Hello\nWorld"
+
+
+def test_fresh_entry_is_served_without_request(server):
+    httpd, base = server
+    first, = MyWeb.fetch_many([base + "/page"])
+    second, = MyWeb.fetch_many([base + "/page"])
+    assert first["text"] == "Hello\nWorld" and not first["cached"]
+    assert second["text"] == "Hello\nWorld" and second["cached"]
+    assert len(httpd.requests) == 1
+
+
+def test_stale_entry_is_revalidated_and_reused_on_304(server, monkeypatch):
+    httpd, base = server
+    MyWeb.fetch_many([base + "/page"])
+    monkeypatch.setattr(MyWeb, "FRESH_SECONDS", 0)
+
+    result, = MyWeb.fetch_many([base + "/page"])
+
+    assert httpd.requests[-1] == ("/page", ETAG, LAST_MODIFIED)
+    # 304 응답에는 본문이 없으므로, 텍스트는 캐시에서 온 것
+    assert result["cached"] and result["text"] == "Hello\nWorld"
+
+
+def test_failing_source_does_not_drop_others(server):
+    httpd, base = server
+    unreachable = "http://127.0.0.1:9/"
+    results = MyWeb.fetch_many([base + "/missing", base + "/page", unreachable])
+
+    assert [r["url"] for r in results] == [base + "/missing", base + "/page", unreachable]
+    assert results[0]["text"] is None and "404" in results[0]["error"]
+    assert results[1]["text"] == "Hello\nWorld"
+    assert results[2]["text"] is None and results[2]["error"]
+
+
+def test_sources_are_fetched_concurrently(server):
+    httpd, base = server
+    urls = [f"{base}/slow/{i}" for i in range(4)]
+
+    started = time.perf_counter()
+    results = MyWeb.fetch_many(urls)
+    elapsed = time.perf_counter() - started
+
+    assert all(r["text"] == "Hello\nWorld" for r in results)
+    assert elapsed < SLOW_SECONDS * len(urls) * 0.75